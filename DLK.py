@@ -1,16 +1,36 @@
 import os
 import re
+import sys
+import signal
+import subprocess
 import time
 import asyncio
 import logging
 import random
 import inspect
-from typing import Union, Optional, Dict, Any, List
-from urllib.parse import urlparse, parse_qs
+import hashlib
+import hmac
+import json
+import difflib
+from io import BytesIO
+from typing import Union, Optional, Dict, Any, List, Tuple
+from urllib.parse import urlparse, parse_qs, urljoin
 
 from pyrogram import Client, filters
+from pyrogram import raw as pyro_raw, utils as pyro_utils
+from pyrogram.raw.core import TLObject
 from pyrogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.errors import RPCError, FloodWait
+try:
+    from pyrogram.errors import (
+        AuthKeyUnregistered, SessionRevoked, UserDeactivated, UserDeactivatedBan,
+        UserBannedInChannel, ChannelPrivate,
+    )
+    ACCOUNT_DEAD_ERRORS: Tuple[type, ...] = (AuthKeyUnregistered, SessionRevoked, UserDeactivated, UserDeactivatedBan)
+    CHAT_BAN_ERRORS: Tuple[type, ...] = (UserBannedInChannel, ChannelPrivate)
+except ImportError:
+    ACCOUNT_DEAD_ERRORS = ()
+    CHAT_BAN_ERRORS = ()
 try:
     from pyrogram.errors import GroupcallForbidden
 except ImportError:
@@ -23,6 +43,14 @@ except ImportError:
 from pyrogram.client import Client as _PyroClient
 from pytgcalls import PyTgCalls
 from pytgcalls.types import MediaStream
+try:
+    from pytgcalls import filters as call_filters
+except ImportError:
+    call_filters = None
+try:
+    from pytgcalls.types import AudioQuality
+except ImportError:
+    AudioQuality = None
 from dotenv import load_dotenv
 
 try:
@@ -32,15 +60,9 @@ except Exception:
 
 import aiohttp
 import aiofiles
+from aiohttp import web
 from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont, ImageOps
 
-try:
-    from youtubesearchpython.__future__ import VideosSearch
-    VIDEOS_SEARCH_AVAILABLE = True
-except Exception:
-    VideosSearch = None
-    VIDEOS_SEARCH_AVAILABLE = False
-
 try:
     from pymongo import MongoClient
 except Exception:
@@ -67,6 +89,34 @@ API_ID = int(os.environ.get("API_ID", "") or "")
 API_HASH = os.environ.get("API_HASH", "")
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
 ASSISTANT_SESSION = os.environ.get("ASSISTANT_SESSION", "")
+# sharded mode: a front process (no SHARD_ID) receives the bot's updates and
+# routes them to SHARD_COUNT workers; worker N owns the chats with
+# abs(chat_id) % SHARD_COUNT == N
+SHARD_COUNT = max(1, int(os.environ.get("SHARD_COUNT", "1") or 1))
+SHARD_ID = int(os.environ["SHARD_ID"]) if os.environ.get("SHARD_ID", "").strip() else None
+# comma separated; falls back to ASSISTANT_SESSION
+ASSISTANT_SESSIONS = [
+    s.strip() for s in os.environ.get("ASSISTANT_SESSIONS", "").split(",") if s.strip()
+] or [ASSISTANT_SESSION]
+# every shard needs its own assistant accounts: one session logged in from
+# several processes risks AUTH_KEY_DUPLICATED, and its call caps and flood
+# state would be split between processes that can't see each other
+SHARD_FALLBACK = SHARD_COUNT > 1 and len(ASSISTANT_SESSIONS) < SHARD_COUNT
+if SHARD_FALLBACK:
+    SHARD_COUNT, SHARD_ID = 1, None
+SHARDED = SHARD_COUNT > 1 and SHARD_ID is not None
+SHARD_OUTBOX_SIZE = int(os.environ.get("SHARD_OUTBOX_SIZE", "1000") or 1000)  # front: updates buffered per worker
+# shared by the front and its workers; routed updates without it are refused
+SHARD_ROUTE_SECRET = os.environ.get("SHARD_ROUTE_SECRET", "").strip() or os.urandom(16).hex()
+if SHARDED:
+    ASSISTANT_SESSIONS = ASSISTANT_SESSIONS[SHARD_ID::SHARD_COUNT]
+ASSISTANT_FLOOD_WINDOW = int(os.environ.get("ASSISTANT_FLOOD_WINDOW", "600") or 600)
+ASSISTANT_FLOOD_WEIGHT = int(os.environ.get("ASSISTANT_FLOOD_WEIGHT", "5") or 5)
+# concurrent call budget (0 = unlimited); requests over it wait in a FIFO room
+MAX_CALLS = int(os.environ.get("MAX_CALLS", "0") or 0)
+MAX_CALLS_PER_ASSISTANT = int(os.environ.get("MAX_CALLS_PER_ASSISTANT", "0") or 0)
+WAITING_ROOM_SIZE = int(os.environ.get("WAITING_ROOM_SIZE", "20") or 0)
+WAITING_ROOM_TIMEOUT = float(os.environ.get("WAITING_ROOM_TIMEOUT", "900") or 900)
 OWNER_ID = int(os.getenv("OWNER_ID", "") or "")
 
 MONGO_URI = os.environ.get("MONGO_URI")
@@ -74,14 +124,114 @@ MONGO_DBNAME = os.environ.get("MONGO_DBNAME", "dlk_radio")
 LOG_CHANNEL_ID = os.environ.get("LOG_CHANNEL_ID", "").strip()
 
 YT_DLP_COOKIES = os.environ.get("YT_DLP_COOKIES")
+# audio-only codecs in order of preference; opus/webm is what the call encodes to
+YTDLP_AUDIO_CODECS = [
+    c.strip() for c in os.environ.get("YTDLP_AUDIO_CODECS", "opus,vorbis,mp4a").split(",") if c.strip()
+]
+YTDLP_TARGET_ABR = int(os.environ.get("YTDLP_TARGET_ABR", "160") or 160)
 
 DEV_LINK = "https://t.me/DLKDEVELOPERS"
 SUPPORT_LINK = "https://t.me/DevDLK"
 
 THUMB_CACHE_DIR = "cache"
 os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
-DOWNLOADS_DIR = "downloads"
+DOWNLOADS_DIR = "downloads" if not SHARDED else os.path.join("downloads", f"shard{SHARD_ID}")
 os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+DOWNLOADS_QUOTA_MB = int(os.environ.get("DOWNLOADS_QUOTA_MB", "1024") or 1024)
+# Telegram files at least this big start playing while still downloading
+PROGRESSIVE_MIN_BYTES = int(os.environ.get("PROGRESSIVE_MIN_MB", "8") or 8) * 1024 * 1024
+
+# parallel Telegram downloads: 1 MiB parts fetched by this many streams per file
+TG_DL_CONNECTIONS = int(os.environ.get("TG_DL_CONNECTIONS", "4") or 4)
+# Telegram transfers at once (Pyrogram's max_concurrent_transmissions); a quarter
+# of them (at least 2) is never used by parallel downloads, so other fetches
+# (plain downloads, progressive playback, thumbnails) always find a free slot
+TG_DL_MAX_INFLIGHT = max(2, int(os.environ.get("TG_DL_MAX_INFLIGHT", "16") or 16))
+TG_DL_PARALLEL_SLOTS = max(1, TG_DL_MAX_INFLIGHT - max(2, TG_DL_MAX_INFLIGHT // 4))
+TG_CHUNK_SIZE = 1024 * 1024
+
+# optional Opus cache of YouTube tracks played at least AUDIO_CACHE_MIN_PLAYS times
+AUDIO_CACHE_ENABLED = os.environ.get("AUDIO_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+AUDIO_CACHE_DIR = os.path.join(THUMB_CACHE_DIR, "audio" if not SHARDED else f"audio{SHARD_ID}")
+AUDIO_CACHE_QUOTA_MB = int(os.environ.get("AUDIO_CACHE_QUOTA_MB", "2048") or 2048)
+AUDIO_CACHE_MIN_PLAYS = int(os.environ.get("AUDIO_CACHE_MIN_PLAYS", "3") or 3)
+AUDIO_CACHE_WORKERS = int(os.environ.get("AUDIO_CACHE_WORKERS", "1") or 1)
+AUDIO_CACHE_BITRATE = os.environ.get("AUDIO_CACHE_BITRATE", "128k")
+if AUDIO_CACHE_ENABLED:
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+
+# local HTTP endpoint ffmpeg reads progressive/relayed media from
+LOCAL_HTTP_HOST = os.environ.get("LOCAL_HTTP_HOST", "127.0.0.1")
+LOCAL_HTTP_PORT = int(os.environ.get("LOCAL_HTTP_PORT", "8089") or 8089) + (SHARD_ID if SHARDED else 0)
+# one upstream connection per radio station shared by every chat playing it
+RADIO_RELAY_ENABLED = os.environ.get("RADIO_RELAY_ENABLED", "true").lower() in ("1", "true", "yes")
+RADIO_RELAY_IDLE_GRACE = float(os.environ.get("RADIO_RELAY_IDLE_GRACE", "10") or 10)
+RADIO_RELAY_BURST_BYTES = 64 * 1024  # recent bytes handed to a new listener for a fast start
+RADIO_RELAY_QUEUE_CHUNKS = 64
+# live radio self-healing
+RADIO_STALL_SECONDS = float(os.environ.get("RADIO_STALL_SECONDS", "15") or 15)
+RADIO_RECONNECT_MAX = int(os.environ.get("RADIO_RECONNECT_MAX", "8") or 8)
+RADIO_BACKOFF_MAX = float(os.environ.get("RADIO_BACKOFF_MAX", "60") or 60)
+# admission control for resolve-heavy commands (/play, /rpush): token buckets per minute
+RATE_USER_PER_MIN = float(os.environ.get("RATE_USER_PER_MIN", "4") or 4)
+RATE_USER_BURST = int(os.environ.get("RATE_USER_BURST", "3") or 3)
+RATE_CHAT_PER_MIN = float(os.environ.get("RATE_CHAT_PER_MIN", "12") or 12)
+RATE_CHAT_BURST = int(os.environ.get("RATE_CHAT_BURST", "6") or 6)
+RATE_GLOBAL_PER_MIN = float(os.environ.get("RATE_GLOBAL_PER_MIN", "120") or 120)
+RATE_GLOBAL_BURST = int(os.environ.get("RATE_GLOBAL_BURST", "30") or 30)
+QUEUE_MAX_PER_CHAT = int(os.environ.get("QUEUE_MAX_PER_CHAT", "50") or 50)
+RESOLVER_CONCURRENCY = int(os.environ.get("RESOLVER_CONCURRENCY", "4") or 4)
+RESOLVER_MAX_WAITING = int(os.environ.get("RESOLVER_MAX_WAITING", "16") or 16)
+# load shedding: level 1 stretches caption timers and pauses log-channel sends,
+# level 2 also skips custom thumbnails
+SHED_LAG_MS = float(os.environ.get("SHED_LAG_MS", "100") or 100)
+SHED_LAG_CRITICAL_MS = float(os.environ.get("SHED_LAG_CRITICAL_MS", "500") or 500)
+SHED_RENDER_DEPTH = int(os.environ.get("SHED_RENDER_DEPTH", "8") or 8)
+SHED_LOG_BACKLOG = int(os.environ.get("SHED_LOG_BACKLOG", "20") or 20)
+SHED_RECOVER_SECONDS = float(os.environ.get("SHED_RECOVER_SECONDS", "30") or 30)
+# idle reaper: leave calls nobody listens to, or that stayed paused too long
+IDLE_EMPTY_GRACE = float(os.environ.get("IDLE_EMPTY_GRACE", "300") or 300)
+IDLE_PAUSE_GRACE = float(os.environ.get("IDLE_PAUSE_GRACE", "1800") or 1800)
+IDLE_REAP_INTERVAL = float(os.environ.get("IDLE_REAP_INTERVAL", "60") or 60)
+# per-chat bookkeeping of chats without a session is dropped after this long
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "3600") or 3600)
+# gapless transitions: prepare the next entry this long before the current one ends;
+# advance on the stream-end update, or this long after the expected end if none comes
+PREFETCH_AHEAD = float(os.environ.get("PREFETCH_AHEAD", "8") or 8)
+TRACK_END_SLACK = float(os.environ.get("TRACK_END_SLACK", "5") or 5)
+YT_URL_MAX_AGE = 4 * 3600  # googlevideo URLs expire after ~6h
+
+# per-chat audio quality; "auto" steps down as the host gets busier
+QUALITY_PROFILES = {
+    "studio": {"audio": "STUDIO", "abr": 256},
+    "high": {"audio": "HIGH", "abr": 160},
+    "medium": {"audio": "MEDIUM", "abr": 96},
+    "low": {"audio": "LOW", "abr": 64},
+}
+DEFAULT_QUALITY = os.environ.get("DEFAULT_QUALITY", "auto")
+QUALITY_MEDIUM_AT_CALLS = int(os.environ.get("QUALITY_MEDIUM_AT_CALLS", "10") or 10)
+QUALITY_LOW_AT_CALLS = int(os.environ.get("QUALITY_LOW_AT_CALLS", "25") or 25)
+QUALITY_MEDIUM_AT_LOAD = float(os.environ.get("QUALITY_MEDIUM_AT_LOAD", "70") or 70)  # % of all cores
+QUALITY_LOW_AT_LOAD = float(os.environ.get("QUALITY_LOW_AT_LOAD", "90") or 90)
+
+# smallest thumbnail width that still looks sharp on the 1280x720 card
+THUMB_MIN_WIDTH = 480
+# i.ytimg.com variants in ascending size; hqdefault (480x360) always exists
+YT_THUMB_VARIANTS = (("hqdefault", 480), ("sddefault", 640), ("maxresdefault", 1280))
+
+# shared HTTP client tuning
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "100") or 100)
+HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", "10") or 10)
+HTTP_DNS_TTL = int(os.environ.get("HTTP_DNS_TTL", "300") or 300)
+HTTP_DOWNLOAD_TIMEOUT = float(os.environ.get("HTTP_DOWNLOAD_TIMEOUT", "20") or 20)
+THUMB_MAX_BYTES = int(os.environ.get("THUMB_MAX_BYTES", str(8 * 1024 * 1024)) or 8 * 1024 * 1024)
+HTTP_CHUNK_SIZE = 64 * 1024
+
+# now-playing card rendering
+THUMB_SIZE = (1280, 720)
+THUMB_ART_DIAMETER = 520
+THUMB_FORMAT = (os.environ.get("THUMB_FORMAT", "jpeg") or "jpeg").lower()  # jpeg | webp
+THUMB_QUALITY = int(os.environ.get("THUMB_QUALITY", "85") or 85)
 
 # fallback duration for tracks without metadata
 DEFAULT_FALLBACK_DURATION = 240  # 4 minutes
@@ -121,9 +271,26 @@ RADIO_STATION = {
     "JAM FM": "http://stream.jam.fm/jamfm-nmr/mp3-192/",
 }
 
+# background station health checks
+RADIO_PROBE_INTERVAL = int(os.environ.get("RADIO_PROBE_INTERVAL", "600") or 600)
+RADIO_PROBE_CONCURRENCY = int(os.environ.get("RADIO_PROBE_CONCURRENCY", "8") or 8)
+RADIO_PROBE_TIMEOUT = float(os.environ.get("RADIO_PROBE_TIMEOUT", "10") or 10)
+RADIO_DEAD_AFTER = max(1, int(os.environ.get("RADIO_DEAD_AFTER", "2") or 2))  # consecutive failed probes
+STREAM_RESOLVE_TTL = int(os.environ.get("STREAM_RESOLVE_TTL", "900") or 900)
+STREAM_RESOLVE_MAX = int(os.environ.get("STREAM_RESOLVE_MAX", "500") or 500)
+# station fetches verify TLS; opt single hosts out with RADIO_TLS_SKIP_HOSTS
+# (comma separated) or "verify_tls": false on a station in RADIO_STATIONS_FILE / db.stations
+RADIO_VERIFY_TLS = os.environ.get("RADIO_VERIFY_TLS", "true").lower() in ("1", "true", "yes")
+RADIO_TLS_SKIP_HOSTS = [h.strip().lower() for h in os.environ.get("RADIO_TLS_SKIP_HOSTS", "").split(",") if h.strip()]
+RADIO_HIDE_DEAD = os.environ.get("RADIO_HIDE_DEAD", "false").lower() in ("1", "true", "yes")
+
+# extra stations: JSON {"name": "url"} or [{"name", "url", "aliases": [...]}]; db.stations is merged too
+RADIO_STATIONS_FILE = os.environ.get("RADIO_STATIONS_FILE", "").strip()
+
 radio_tasks: Dict[int, asyncio.Task] = {}        # song timer tasks only
 radio_paused = set()
-radio_state: Dict[int, Dict[str, Any]] = {}      # current playback state (song or radio)
+radio_state: Dict[int, "PlaybackSession"] = {}   # current playback session per chat
+chat_activity: Dict[int, float] = {}             # chat_id -> last playback activity
 radio_queue: Dict[int, List[Dict[str, Any]]] = {}
 track_watchers: Dict[int, asyncio.Task] = {}
 bot_start_time = time.time()
@@ -132,9 +299,248 @@ BOT_USERNAME = None
 ASSISTANT_USERNAME = None
 ASSISTANT_ID = None
 
-bot = Client("dlk_radio_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
-assistant = Client("assistant_account", session_string=ASSISTANT_SESSION)
-call_py = PyTgCalls(assistant)
+bot = Client(
+    "dlk_radio_bot" if not SHARDED else f"dlk_radio_bot_{SHARD_ID}",
+    api_id=API_ID,
+    api_hash=API_HASH,
+    bot_token=BOT_TOKEN,
+    max_concurrent_transmissions=TG_DL_MAX_INFLIGHT,
+    no_updates=SHARDED,  # a worker gets its updates from the front process
+)
+
+class PlaybackSession:
+    """
+    What a chat is playing (song or radio); duration None means live radio.
+    """
+
+    __slots__ = ("chat_id", "station", "url", "msg_id", "start_time", "elapsed", "paused", "duration", "media_key", "ts")
+
+    def __init__(
+        self,
+        chat_id: int,
+        station: str,
+        url: str,
+        msg_id: int,
+        start_time: Optional[float],
+        elapsed: float = 0.0,
+        paused: bool = False,
+        duration: Optional[int] = None,
+        media_key: Optional[str] = None,
+    ):
+        self.chat_id = chat_id
+        self.station = station
+        self.url = url
+        self.msg_id = msg_id
+        self.start_time = start_time
+        self.elapsed = elapsed
+        self.paused = paused
+        self.duration = duration
+        self.media_key = media_key
+        self.ts = time.time()
+
+class AssistantSlot:
+    """
+    One assistant user account and its PyTgCalls instance.
+    """
+
+    def __init__(self, index: int, session: str):
+        self.index = index
+        name = "assistant_account" if index == 0 else f"assistant_account_{index}"
+        self.client = Client(name, session_string=session)
+        self.calls = PyTgCalls(self.client)
+        self.id: Optional[int] = None
+        self.username: Optional[str] = None
+        self.chats: set = set()          # chats with an active call
+        self.floods: List[float] = []    # recent FloodWait timestamps
+        self.flood_until = 0.0
+        self.dead = False                # session revoked / account banned
+
+    def available(self) -> bool:
+        return not self.dead and time.time() >= self.flood_until
+
+    def full(self) -> bool:
+        return bool(MAX_CALLS_PER_ASSISTANT) and len(self.chats) >= MAX_CALLS_PER_ASSISTANT
+
+    def load(self) -> int:
+        cutoff = time.time() - ASSISTANT_FLOOD_WINDOW
+        self.floods = [ts for ts in self.floods if ts >= cutoff]
+        return len(self.chats) + ASSISTANT_FLOOD_WEIGHT * len(self.floods)
+
+assistants: List[AssistantSlot] = [AssistantSlot(i, s) for i, s in enumerate(ASSISTANT_SESSIONS)]
+assistant = assistants[0].client
+call_py = assistants[0].calls
+
+# ---------- SHARDING ----------
+def owns_chat(chat_id: Optional[int]) -> bool:
+    return not SHARDED or shard_for(chat_id) == SHARD_ID
+
+def update_chat_id(update) -> Optional[int]:
+    """
+    Chat a raw update belongs to (messages, edits, callback queries).
+    """
+    peer = getattr(getattr(update, "message", None), "peer_id", None) or getattr(update, "peer", None)
+    if peer is None:
+        return None
+    try:
+        return pyro_utils.get_peer_id(peer)
+    except Exception:
+        return None
+
+def shard_for(chat_id: Optional[int]) -> int:
+    return 0 if chat_id is None else abs(chat_id) % SHARD_COUNT
+
+shard_route_stats = {"routed": 0, "dropped": 0}
+
+class ShardRouter(asyncio.Queue):
+    """
+    Takes the place of the front bot's dispatcher queue: instead of
+    running handlers, each update (with the users and chats it refers to)
+    goes to its shard's outbox, which posts it in order to that worker's
+    local endpoint.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.outboxes = [asyncio.Queue(maxsize=SHARD_OUTBOX_SIZE) for _ in range(SHARD_COUNT)]
+
+    def put_nowait(self, item):
+        if item is None:
+            return super().put_nowait(item)  # Dispatcher.stop() waking its workers
+        update, users, chats = item
+        packed = pyro_raw.types.Updates(
+            updates=[update], users=list(users.values()), chats=list(chats.values()), date=0, seq=0
+        ).write()
+        try:
+            self.outboxes[shard_for(update_chat_id(update))].put_nowait(packed)
+            shard_route_stats["routed"] += 1
+        except asyncio.QueueFull:
+            shard_route_stats["dropped"] += 1
+
+    async def forward(self, shard: int):
+        url = f"http://{LOCAL_HTTP_HOST}:{LOCAL_HTTP_PORT + shard}/updates"
+        outbox = self.outboxes[shard]
+        while True:
+            packed = await outbox.get()
+            for attempt in range(6):
+                try:
+                    headers = {"X-Shard-Secret": SHARD_ROUTE_SECRET}
+                    async with get_http_session().post(url, data=packed, headers=headers) as resp:
+                        if resp.status < 300:
+                            break
+                        if resp.status < 500:
+                            logging.warning(f"Shard {shard} refused an update: HTTP {resp.status}")
+                            shard_route_stats["dropped"] += 1
+                            break
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                await asyncio.sleep(min(10, 2 ** attempt))  # worker (re)starting
+            else:
+                shard_route_stats["dropped"] += 1
+                logging.warning(
+                    f"Shard {shard} unreachable; dropped an update "
+                    f"({shard_route_stats['dropped']} dropped, {shard_route_stats['routed']} routed)"
+                )
+
+async def _serve_updates(request: web.Request) -> web.Response:
+    """
+    Worker side of the router: feed the front's updates to our dispatcher.
+    Only the front knows the secret, so nobody else reaching the local
+    port can inject (e.g. owner) commands.
+    """
+    if not hmac.compare_digest(request.headers.get("X-Shard-Secret", ""), SHARD_ROUTE_SECRET):
+        raise web.HTTPForbidden()
+    updates = TLObject.read(BytesIO(await request.read()))
+    await bot.handle_updates(updates)
+    return web.Response(status=204)
+
+async def start_routed_dispatch():
+    """
+    no_updates keeps the worker's session from receiving updates, but it
+    also stops Pyrogram from starting its handler workers; start them so
+    routed updates reach the handlers.
+    """
+    dispatcher = bot.dispatcher
+    for _ in range(bot.workers):
+        lock = asyncio.Lock()
+        dispatcher.locks_list.append(lock)
+        dispatcher.handler_worker_tasks.append(dispatcher.loop.create_task(dispatcher.handler_worker(lock)))
+    logging.info(f"Shard {SHARD_ID}: {bot.workers} handler workers for routed updates")
+
+async def _supervise_shards(stop: asyncio.Event):
+    """
+    Start one worker per shard and restart any that exits, backing off
+    when a worker keeps crashing.
+    """
+    procs: Dict[int, subprocess.Popen] = {}
+    started: Dict[int, float] = {}
+    restarts: Dict[int, int] = {}
+    pending: Dict[int, float] = {}  # shard -> time to respawn
+
+    def _spawn(i: int):
+        env = dict(os.environ, SHARD_ID=str(i), SHARD_COUNT=str(SHARD_COUNT), SHARD_ROUTE_SECRET=SHARD_ROUTE_SECRET)
+        procs[i] = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+        started[i] = time.time()
+        logging.info(f"Shard {i}/{SHARD_COUNT} started (pid {procs[i].pid})")
+
+    for i in range(SHARD_COUNT):
+        _spawn(i)
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+            for i, proc in list(procs.items()):
+                code = proc.poll()
+                if code is None:
+                    continue
+                procs.pop(i)
+                if time.time() - started[i] > 60:
+                    restarts[i] = 0
+                restarts[i] = restarts.get(i, 0) + 1
+                delay = min(60, 2 ** restarts[i])
+                pending[i] = time.time() + delay
+                logging.warning(f"Shard {i} exited with {code}; restarting in {delay}s")
+            for i, at in list(pending.items()):
+                if time.time() >= at:
+                    pending.pop(i)
+                    _spawn(i)
+    finally:
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, proc.wait, 15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+async def _run_shard_front():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    router = ShardRouter()
+    bot.dispatcher.updates_queue = router  # before start(): no handlers run here
+    supervisor = asyncio.create_task(_supervise_shards(stop))
+    await bot.start()
+    forwarders = [asyncio.create_task(router.forward(i)) for i in range(SHARD_COUNT)]
+    try:
+        await supervisor
+    finally:
+        for task in forwarders:
+            task.cancel()
+        try:
+            await bot.stop()
+        except Exception:
+            pass
+        await close_http_session()
+
+def run_shard_front():
+    """
+    Front process: the only bot session that receives updates. It routes
+    each update to the worker owning its chat and supervises the workers.
+    """
+    asyncio.get_event_loop().run_until_complete(_run_shard_front())
 
 db_client = None
 db = None
@@ -193,6 +599,11 @@ TRANSLATIONS = {
         "RADIO_STOPPED_BTN": "DLK BOT stopped!",
         "RADIO_STOP_FAIL_BTN": "Failed to stop bot.",
         "STATION_URL_NOT_FOUND": "Station URL not found!",
+        "STATION_OFFLINE": "📴 {station} is offline right now. Try another station.",
+        "STREAM_BROKEN": "❌ This stream could not be opened: {error}",
+        "STATION_SEARCH_RESULTS": "📻 Stations matching \"{query}\":",
+        "NO_STATION_MATCH": "No station matches \"{query}\".",
+        "STATION_DID_YOU_MEAN": "No station is called \"{query}\". Did you mean: {names}?\nUse the full name, e.g. /rpush {first}",
         "ASSISTANT_BLOCKED_GROUP": "This group is blocked from using DLK BOT.",
         "ASSISTANT_NOT_IN_GROUP": "Assistant is not in this group. Please add the assistant account and try again.",
         "ASSISTANT_INVITE_TEXT": "Assistant not in group. I've created an invite link — add the assistant account manually and give it permission to speak.",
@@ -207,6 +618,15 @@ TRANSLATIONS = {
         ),
         "RADIO_CONNECTING": "🎧 Connecting to {station}...",
         "RATE_LIMIT": "⏳ Rate limit reached! Wait {seconds} seconds.",
+        "IDLE_LEFT_EMPTY": "👋 Left the voice chat because nobody was listening for {minutes} min.",
+        "IDLE_LEFT_PAUSED": "👋 Left the voice chat after it stayed paused for {minutes} min.",
+        "CALLS_WAITING": "🚦 All voice slots are busy. You're #{position} in line; playback starts automatically when one frees up.",
+        "CALLS_FULL": "🚦 All voice slots are busy and the waiting line is full. Try again in about {minutes} min.",
+        "CALLS_WAIT_TIMEOUT": "🚦 No voice slot freed up in time, so the request was dropped. Please try again later.",
+        "RATE_LIMITED_USER": "⏳ Slow down! You can request again in {seconds}s.",
+        "RATE_LIMITED_CHAT": "⏳ This group is sending requests too fast. Try again in {seconds}s.",
+        "BOT_BUSY": "⏳ The bot is busy right now. Try again in {seconds}s.",
+        "QUEUE_FULL": "📜 The queue is full ({limit} tracks). Wait for some to finish.",
         "VOICECHAT_NOT_READY": "❌ Cannot connect to voice chat! Ensure voice chat is active and assistant has permissions.",
         "RADIO_PLAY_FAILED_ASSIST": "Failed to play radio! Assistant error: {error}",
         "RADIO_START_FAIL": "❌ Failed to start radio! Error: {error}",
@@ -230,6 +650,7 @@ TRANSLATIONS = {
             "- Admins can use pause/resume/skip/stop via the inline buttons.\n"
             "- Owner-only commands: /bl and /unbl in a group to block/unblock the group.\n"
             "- Use /lang to change bot language in this chat.\n"
+            "- Admins can use /quality to pick the audio quality profile.\n"
         ),
         "LANG_MENU_TITLE": "🌐 Chat language settings",
         "CHOOSE_LANG": "🌐 Choose the language for this chat:",
@@ -237,6 +658,10 @@ TRANSLATIONS = {
         "LANG_CHANGED": "✅ Language changed to {lang_name}.",
         "UNKNOWN_LANG": "Unknown language.",
         "NOTHING_TO_RESUME_BTN": "Nothing to resume.",
+        "QUALITY_MENU": "🎚 Audio quality for this chat:\nAuto lowers quality when the bot is busy.",
+        "QUALITY_CURRENT": "Current quality: {profile}",
+        "QUALITY_CHANGED": "✅ Audio quality set to {profile}. Applies from the next track.",
+        "UNKNOWN_QUALITY": "Unknown quality profile.",
     },
     "si": {
         "GROUP_BLOCKED": "❌ මේ group එකට DLK BOT භාවිතා කරන්න බැරි වෙන්න block කරලා තියෙන්නේ.",
@@ -290,6 +715,11 @@ TRANSLATIONS = {
         "RADIO_STOPPED_BTN": "DLK BOT ව නවත්වලා!",
         "RADIO_STOP_FAIL_BTN": "Bot නවත්තන එක කරන්න බැරි උනා.",
         "STATION_URL_NOT_FOUND": "මේ station එකට URL එක හම්බුනේ නෑ!",
+        "STATION_OFFLINE": "📴 {station} දැන් offline. වෙන station එකක් try කරන්න.",
+        "STREAM_BROKEN": "❌ මේ stream එක open කරන්න බැරි උනා: {error}",
+        "STATION_SEARCH_RESULTS": "📻 \"{query}\" ට ගැලපෙන stations:",
+        "NO_STATION_MATCH": "\"{query}\" ට ගැලපෙන station එකක් නෑ.",
+        "STATION_DID_YOU_MEAN": "\"{query}\" කියලා station එකක් නෑ. ඔයා අදහස් කළේ: {names}?\nසම්පූර්ණ නම දෙන්න, උදා: /rpush {first}",
         "ASSISTANT_BLOCKED_GROUP": "මේ group එකට DLK BOT භාවිතා කරන්න බැරි වෙන්න block කරලා තියෙන්නේ.",
         "ASSISTANT_NOT_IN_GROUP": "Assistant මේ group එකේ නෑ. Assistant account එක add කරලා නැවත උත්සහ කරන්න.",
         "ASSISTANT_INVITE_TEXT": "Assistant group එකේ නෑ. Invite link එකක් හදලා දීලා තියෙනවා — assistant account එක manually add කරලා voice chat permission දීලා බලන්න.",
@@ -304,6 +734,15 @@ TRANSLATIONS = {
         ),
         "RADIO_CONNECTING": "🎧 {station} station එකට connect වෙනවා...",
         "RATE_LIMIT": "⏳ FloodWait! තවත් {seconds} seconds ඉන්න.",
+        "IDLE_LEFT_EMPTY": "👋 මිනිත්තු {minutes} ක් කවුරුත් අහගෙන හිටියේ නැති නිසා voice chat එකෙන් අයින් උනා.",
+        "IDLE_LEFT_PAUSED": "👋 මිනිත්තු {minutes} ක් pause කරලා තිබ්බ නිසා voice chat එකෙන් අයින් උනා.",
+        "CALLS_WAITING": "🚦 Voice slots ඔක්කොම busy. ඔයා පෝලිමේ #{position}; slot එකක් නිදහස් උන ගමන් auto play වෙනවා.",
+        "CALLS_FULL": "🚦 Voice slots ඔක්කොම busy, පෝලිමත් පිරිලා. මිනිත්තු {minutes} කින් විතර නැවත උත්සහ කරන්න.",
+        "CALLS_WAIT_TIMEOUT": "🚦 වෙලාවට slot එකක් නිදහස් උනේ නැති නිසා request එක අයින් කලා. පස්සේ නැවත උත්සහ කරන්න.",
+        "RATE_LIMITED_USER": "⏳ ටිකක් හෙමින්! තවත් {seconds}s කින් ආයෙත් request කරන්න.",
+        "RATE_LIMITED_CHAT": "⏳ මේ group එකෙන් requests ඕනවට වඩා එනවා. {seconds}s කින් නැවත උත්සහ කරන්න.",
+        "BOT_BUSY": "⏳ Bot දැන් busy. {seconds}s කින් නැවත උත්සහ කරන්න.",
+        "QUEUE_FULL": "📜 Queue එක පිරිලා ({limit} tracks). ටිකක් ඉවර වෙනකම් ඉන්න.",
         "VOICECHAT_NOT_READY": "❌ Voice chat එක active නැති නිසා connect වෙන්න බැ. Voice chat on කරලා permissions check කරලා බලන්න.",
         "RADIO_PLAY_FAILED_ASSIST": "Radio play කිරීම කරන්න බැරි උනා! Assistant error: {error}",
         "RADIO_START_FAIL": "❌ Radio start කිරීම කරන්න බැරි උනා! Error: {error}",
@@ -327,6 +766,7 @@ TRANSLATIONS = {
             "- Inline buttons වලින් pause/resume/skip/stop control කරන්න පුළුවන්.\n"
             "- Owner-only: /bl /unbl group block/unblock.\n"
             "- /lang දාලා භාෂාව වෙනස් කරන්න පුළුවන්.\n"
+            "- /quality දාලා admins ලට audio quality එක තෝරන්න පුළුවන්.\n"
         ),
         "LANG_MENU_TITLE": "🌐 Chat භාෂා සැකසුම්",
         "CHOOSE_LANG": "🌐 මේ chat එකට භාවිතා කරන භාෂාව තෝරන්න:",
@@ -334,6 +774,10 @@ TRANSLATIONS = {
         "LANG_CHANGED": "✅ භාෂාව {lang_name} ට වෙනස් කරා.",
         "UNKNOWN_LANG": "මන් තාම ඉගෙන ගෙන නැති භාෂාවක්.",
         "NOTHING_TO_RESUME_BTN": "Resume කරන්න ගීතයක් නෑ.",
+        "QUALITY_MENU": "🎚 මේ chat එකේ audio quality එක:\nBot busy වෙද්දී Auto එකෙන් quality අඩු කරනවා.",
+        "QUALITY_CURRENT": "දැන් තියෙන quality එක: {profile}",
+        "QUALITY_CHANGED": "✅ Audio quality එක {profile} ට වෙනස් කරා. ඊළඟ ගීතයේ ඉඳන් වැඩ කරයි.",
+        "UNKNOWN_QUALITY": "නොදන්න quality profile එකක්.",
     },
 }
 
@@ -387,6 +831,69 @@ def lang_keyboard(current: str) -> InlineKeyboardMarkup:
         buttons.append([InlineKeyboardButton(label, callback_data=f"set_lang_{code}")])
     return InlineKeyboardMarkup(buttons)
 
+# ---------- QUALITY PROFILES ----------
+QUALITY_CHOICES = ["auto"] + list(QUALITY_PROFILES)
+
+def get_chat_quality(chat_id: int) -> str:
+    default = DEFAULT_QUALITY if DEFAULT_QUALITY in QUALITY_CHOICES else "auto"
+    try:
+        if db is None:
+            return default
+        row = db.quality.find_one({"chat_id": chat_id})
+        choice = (row or {}).get("profile") or default
+        return choice if choice in QUALITY_CHOICES else default
+    except Exception:
+        return default
+
+def set_chat_quality(chat_id: int, profile: str):
+    if profile not in QUALITY_CHOICES or db is None:
+        return
+    try:
+        db.quality.update_one(
+            {"chat_id": chat_id},
+            {"$set": {"chat_id": chat_id, "profile": profile, "ts": time.time()}},
+            upsert=True,
+        )
+    except Exception as e:
+        logging.warning(f"Failed to set quality for chat {chat_id}: {e}")
+
+def auto_quality_profile() -> str:
+    calls = len(radio_state)
+    try:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1) * 100
+    except (OSError, AttributeError):
+        load = 0.0
+    if calls >= QUALITY_LOW_AT_CALLS or load >= QUALITY_LOW_AT_LOAD:
+        return "low"
+    if calls >= QUALITY_MEDIUM_AT_CALLS or load >= QUALITY_MEDIUM_AT_LOAD:
+        return "medium"
+    return "high"
+
+def effective_quality(chat_id: int) -> str:
+    choice = get_chat_quality(chat_id)
+    return auto_quality_profile() if choice == "auto" else choice
+
+def quality_abr(chat_id: int) -> int:
+    return QUALITY_PROFILES[effective_quality(chat_id)]["abr"]
+
+def build_media_stream(chat_id: int, source: str) -> MediaStream:
+    profile = effective_quality(chat_id)
+    kwargs = {}
+    if AudioQuality is not None:
+        kwargs["audio_parameters"] = getattr(AudioQuality, QUALITY_PROFILES[profile]["audio"])
+    flags = getattr(MediaStream, "Flags", None)
+    if flags is not None:
+        kwargs["video_flags"] = flags.IGNORE  # audio-only calls: never decode video
+    logging.debug(f"MediaStream for {chat_id}: profile {profile}")
+    return MediaStream(source, **kwargs)
+
+def quality_keyboard(current: str) -> InlineKeyboardMarkup:
+    buttons = []
+    for name in QUALITY_CHOICES:
+        label = f"✅ {name.title()}" if name == current else name.title()
+        buttons.append(InlineKeyboardButton(label, callback_data=f"set_quality_{name}"))
+    return InlineKeyboardMarkup([buttons[:3], buttons[3:]])
+
 # ---------- UTIL ----------
 def looks_like_url(text: str) -> bool:
     try:
@@ -411,13 +918,79 @@ def get_youtube_id(url: str) -> Optional[str]:
         pass
     return None
 
-def extract_audio_url(query: str) -> Optional[Dict[str, Any]]:
+def youtube_thumb_url(video_id: str, min_width: int = THUMB_MIN_WIDTH) -> str:
+    for name, width in YT_THUMB_VARIANTS:
+        if width >= min_width:
+            return f"https://i.ytimg.com/vi/{video_id}/{name}.jpg"
+    return f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+
+def pick_thumbnail(info: Dict[str, Any], min_width: int = THUMB_MIN_WIDTH) -> Optional[str]:
+    """
+    Smallest adequate thumbnail from resolver metadata, no extra lookups.
+    """
+    sized = []
+    for th in info.get("thumbnails") or []:
+        url = th.get("url")
+        width = th.get("width")
+        if url and width:
+            sized.append((int(width), url))
+    adequate = sorted(x for x in sized if x[0] >= min_width)
+    if adequate:
+        return adequate[0][1]
+    vid_id = info.get("id") if info.get("extractor_key") == "Youtube" else None
+    if vid_id:
+        return youtube_thumb_url(vid_id, min_width)
+    if sized:
+        return max(sized)[1]
+    return info.get("thumbnail")
+
+# ---------- SINGLE FLIGHT ----------
+_inflight: Dict[str, asyncio.Future] = {}
+coalesce_stats: Dict[str, Dict[str, int]] = {}
+
+async def single_flight(kind: str, key: str, factory):
+    """
+    Run factory() once per (kind, key); concurrent callers await the same
+    task instead of starting a duplicate. The task is shielded so one
+    cancelled caller does not cancel it for the others.
+    """
+    stats = coalesce_stats.setdefault(kind, {"calls": 0, "coalesced": 0})
+    stats["calls"] += 1
+    full_key = f"{kind}:{key}"
+    task = _inflight.get(full_key)
+    if task is not None:
+        stats["coalesced"] += 1
+    else:
+        task = asyncio.ensure_future(factory())
+        _inflight[full_key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(full_key, None))
+    return await asyncio.shield(task)
+
+def build_audio_format(target_abr: int = YTDLP_TARGET_ABR) -> str:
+    """
+    yt-dlp selector: preferred audio-only codecs at or under the target
+    bitrate first, then above it, then anything audio.
+    """
+    capped = [f"bestaudio[acodec^={c}][abr<={target_abr}]" for c in YTDLP_AUDIO_CODECS]
+    uncapped = [f"bestaudio[acodec^={c}]" for c in YTDLP_AUDIO_CODECS]
+    return "/".join(capped + uncapped + ["bestaudio[vcodec=none]", "bestaudio", "best"])
+
+def _format_rank(f: Dict[str, Any], target_abr: int):
+    acodec = (f.get("acodec") or "none").lower()
+    codec_rank = next(
+        (i for i, c in enumerate(YTDLP_AUDIO_CODECS) if acodec.startswith(c)), len(YTDLP_AUDIO_CODECS)
+    )
+    audio_only = (f.get("vcodec") or "none") == "none"
+    abr = f.get("abr") or 0
+    return (not audio_only, codec_rank, abr > target_abr, abs(target_abr - abr))
+
+def extract_audio_url(query: str, target_abr: int = YTDLP_TARGET_ABR) -> Optional[Dict[str, Any]]:
     if youtube_dl is None:
         logging.warning("yt_dlp not installed.")
         return None
     target = query if looks_like_url(query) else f"ytsearch1:{query}"
     ydl_opts = {
-        "format": "bestaudio/best",
+        "format": build_audio_format(target_abr),
         "quiet": True,
         "no_warnings": True,
         "skip_download": True,
@@ -433,14 +1006,16 @@ def extract_audio_url(query: str) -> Optional[Dict[str, Any]]:
             if "entries" in info and isinstance(info["entries"], list) and info["entries"]:
                 info = info["entries"][0]
             stream_url = info.get("url")
+            acodec = info.get("acodec")
             if not stream_url and "formats" in info:
-                formats = info.get("formats", [])
-                best = None
-                for f in sorted(formats, key=lambda x: (x.get("abr") or 0), reverse=True):
-                    if f.get("acodec") and f.get("url"):
-                        best = f.get("url")
-                        break
-                stream_url = best or stream_url
+                formats = [
+                    f for f in info.get("formats", [])
+                    if f.get("url") and (f.get("acodec") or "none") != "none"
+                ]
+                if formats:
+                    best = min(formats, key=lambda f: _format_rank(f, target_abr))
+                    stream_url = best.get("url")
+                    acodec = best.get("acodec")
             if not stream_url:
                 logging.warning("yt_dlp: no stream_url")
                 return None
@@ -454,13 +1029,183 @@ def extract_audio_url(query: str) -> Optional[Dict[str, Any]]:
                 "title": info.get("title") or "Unknown",
                 "webpage_url": info.get("webpage_url") or info.get("id") or target,
                 "stream_url": stream_url,
-                "thumbnail": info.get("thumbnail"),
+                "thumbnail": pick_thumbnail(info),
                 "duration": duration,
+                "video_id": info.get("id") if info.get("extractor_key") == "Youtube" else None,
+                "acodec": acodec,
             }
     except Exception as e:
         logging.warning(f"yt_dlp failed: {e}")
         return None
 
+class ResolverBusy(Exception):
+    pass
+
+resolver_stats = {"running": 0, "waiting": 0, "rejected": 0}
+_resolver_slots = asyncio.Semaphore(RESOLVER_CONCURRENCY)
+
+async def _extract_limited(query: str, target_abr: int) -> Optional[Dict[str, Any]]:
+    """
+    At most RESOLVER_CONCURRENCY yt-dlp threads; new work is refused once
+    RESOLVER_MAX_WAITING lookups are already queued.
+    """
+    if resolver_stats["waiting"] >= RESOLVER_MAX_WAITING:
+        resolver_stats["rejected"] += 1
+        raise ResolverBusy()
+    resolver_stats["waiting"] += 1
+    try:
+        await _resolver_slots.acquire()
+    finally:
+        resolver_stats["waiting"] -= 1
+    resolver_stats["running"] += 1
+    try:
+        return await asyncio.to_thread(extract_audio_url, query, target_abr)
+    finally:
+        resolver_stats["running"] -= 1
+        _resolver_slots.release()
+
+async def resolve_track(query: str, target_abr: int = YTDLP_TARGET_ABR) -> Optional[Dict[str, Any]]:
+    """
+    Non-blocking extract_audio_url, coalesced by video id, the URL as given
+    (URLs are case-sensitive) or the normalized search text.
+    Raises ResolverBusy when the resolver is saturated.
+    """
+    query_key = query.strip()
+    if looks_like_url(query_key):
+        query_key = get_youtube_id(query_key) or query_key
+    else:
+        query_key = " ".join(query_key.lower().split())
+    key = f"{query_key}@{target_abr}"
+    return await single_flight("resolve", key, lambda: _extract_limited(query, target_abr))
+
+# ---------- ADMISSION CONTROL ----------
+class TokenBuckets:
+    """
+    One token bucket per key: `rate` tokens a minute, up to `burst`.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int = 10000):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self.buckets: Dict[Any, Tuple[float, float]] = {}  # key -> (tokens, ts)
+
+    def _tokens(self, key, now: float) -> float:
+        tokens, ts = self.buckets.get(key, (float(self.burst), now))
+        return min(float(self.burst), tokens + (now - ts) * self.rate)
+
+    def wait_time(self, key, now: float) -> float:
+        tokens = self._tokens(key, now)
+        if tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - tokens) / self.rate
+
+    def take(self, key, now: float):
+        self.buckets[key] = (self._tokens(key, now) - 1, now)
+        if len(self.buckets) > self.max_keys:
+            self.prune(now)
+
+    def prune(self, now: float):
+        # full buckets carry no state worth keeping
+        for k in [k for k in self.buckets if self._tokens(k, now) >= self.burst]:
+            self.buckets.pop(k, None)
+
+user_buckets = TokenBuckets(RATE_USER_PER_MIN, RATE_USER_BURST)
+chat_buckets = TokenBuckets(RATE_CHAT_PER_MIN, RATE_CHAT_BURST)
+global_bucket = TokenBuckets(RATE_GLOBAL_PER_MIN, RATE_GLOBAL_BURST)
+admission_stats = {"admitted": 0, "user": 0, "chat": 0, "global": 0, "queue_full": 0}
+
+def admit_request(chat_id: int, user_id: Optional[int]) -> Optional[str]:
+    """
+    None if the request may go ahead (tokens taken from every bucket),
+    else the localized rejection text.
+    """
+    if user_id == OWNER_ID:
+        return None
+    if len(radio_queue.get(chat_id) or []) >= QUEUE_MAX_PER_CHAT:
+        admission_stats["queue_full"] += 1
+        return t(chat_id, "QUEUE_FULL", limit=QUEUE_MAX_PER_CHAT)
+    now = time.monotonic()
+    checks = (
+        ("user", user_buckets, user_id, "RATE_LIMITED_USER"),
+        ("chat", chat_buckets, chat_id, "RATE_LIMITED_CHAT"),
+        ("global", global_bucket, None, "BOT_BUSY"),
+    )
+    for name, buckets, key, text_key in checks:
+        wait = buckets.wait_time(key, now)
+        if wait > 0:
+            admission_stats[name] += 1
+            return t(chat_id, text_key, seconds=int(wait) + 1 if wait != float("inf") else 60)
+    for _, buckets, key, _ in checks:
+        buckets.take(key, now)
+    admission_stats["admitted"] += 1
+    return None
+
+# ---------- LOAD SHEDDING ----------
+SHED_NAMES = ("normal", "degraded", "critical")
+SHED_TIMER_STRETCH = (1, 3, 6)
+shed_level = 0
+health = {"lag_ms": 0.0, "render_depth": 0, "log_backlog": 0, "logs_dropped": 0, "flood_until": 0.0, "changes": 0}
+
+def note_outbound_flood(e: FloodWait) -> int:
+    wait = int(getattr(e, "value", None) or getattr(e, "x", None) or 5)
+    health["flood_until"] = max(health["flood_until"], time.time() + wait)
+    return wait
+
+def _shed_target(scale: float) -> int:
+    """
+    Level the current measurements call for, with thresholds times `scale`
+    (scale < 1 makes recovery stricter than entry).
+    """
+    lag = health["lag_ms"]
+    waiting = resolver_stats["waiting"]
+    if (
+        lag >= SHED_LAG_CRITICAL_MS * scale
+        or health["render_depth"] >= 2 * SHED_RENDER_DEPTH * scale
+        or waiting >= RESOLVER_MAX_WAITING * scale
+    ):
+        return 2
+    if (
+        lag >= SHED_LAG_MS * scale
+        or health["render_depth"] >= SHED_RENDER_DEPTH * scale
+        or waiting >= RESOLVER_MAX_WAITING / 2 * scale
+        or health["log_backlog"] >= SHED_LOG_BACKLOG * scale
+        or time.time() < health["flood_until"]
+    ):
+        return 1
+    return 0
+
+async def health_monitor_loop(interval: float = 1.0):
+    """
+    Sample event-loop lag and queue depths once a second and move
+    shed_level: up as soon as a threshold is crossed, down one step only
+    after SHED_RECOVER_SECONDS below half the thresholds.
+    """
+    global shed_level
+    calm_since = None
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        lag_ms = max(0.0, (time.monotonic() - start - interval) * 1000)
+        health["lag_ms"] = 0.7 * health["lag_ms"] + 0.3 * lag_ms
+        health["render_depth"] = sum(1 for k in _inflight if k.startswith("render:"))
+        if _shed_target(1.0) > shed_level:
+            shed_level = _shed_target(1.0)
+            calm_since = None
+            health["changes"] += 1
+            logging.warning(f"Load shedding: {SHED_NAMES[shed_level]} (lag {health['lag_ms']:.0f} ms)")
+        elif shed_level and _shed_target(0.5) < shed_level:
+            calm_since = calm_since or time.monotonic()
+            if time.monotonic() - calm_since >= SHED_RECOVER_SECONDS:
+                shed_level -= 1
+                calm_since = None
+                health["changes"] += 1
+                logging.info(f"Load shedding: back to {SHED_NAMES[shed_level]}")
+        else:
+            calm_since = None
+
 # ---------- THUMBNAILS ----------
 def changeImageSize(maxWidth, maxHeight, image):
     widthRatio = maxWidth / image.size[0]
@@ -477,24 +1222,60 @@ def clear_title(text: str) -> str:
             title += " " + i
     return title.strip()
 
-async def _download_file(url: str, dest: str) -> Optional[str]:
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    return None
-                os.makedirs(os.path.dirname(dest), exist_ok=True)
-                f = await aiofiles.open(dest, mode="wb")
-                await f.write(await resp.read())
-                await f.close()
-                return dest
+_http_session: Optional[aiohttp.ClientSession] = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    One pooled session for the whole app (keep-alive + DNS cache).
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            enable_cleanup_closed=True,
+        )
+        # no total timeout here: long-lived streams share this session
+        timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_connect=10, sock_read=30)
+        _http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _http_session
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+async def _download_file(url: str, dest: str, max_bytes: int = THUMB_MAX_BYTES) -> Optional[str]:
+    part = dest + ".part"
+    try:
+        session = get_http_session()
+        timeout = aiohttp.ClientTimeout(total=HTTP_DOWNLOAD_TIMEOUT)
+        async with session.get(url, timeout=timeout) as resp:
+            if resp.status != 200:
+                return None
+            if resp.content_length is not None and resp.content_length > max_bytes:
+                logging.debug(f"_download_file: {url} too large ({resp.content_length} bytes)")
+                return None
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            written = 0
+            async with aiofiles.open(part, mode="wb") as f:
+                async for chunk in resp.content.iter_chunked(HTTP_CHUNK_SIZE):
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise ValueError(f"response exceeds {max_bytes} bytes")
+                    await f.write(chunk)
+            os.replace(part, dest)
+            return dest
     except Exception as e:
         logging.debug(f"_download_file failed: {e}")
-        try:
-            if os.path.exists(dest):
-                os.remove(dest)
-        except Exception:
-            pass
+        for path in (part, dest):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except Exception:
+                pass
         return None
 
 def _create_circular_artwork(image: Image.Image, diameter: int = 520, border: int = 8) -> Image.Image:
@@ -525,83 +1306,151 @@ def _create_circular_artwork(image: Image.Image, diameter: int = 520, border: in
     out.paste(circ, (border, border), circ)
     return out
 
+_cpu_sample = {"wall": time.monotonic(), "cpu": 0.0}
+
+def process_cpu_seconds() -> float:
+    """
+    CPU seconds of this process plus its children (ffmpeg decoders), live
+    ones read from /proc where available.
+    """
+    times = os.times()
+    total = times.user + times.system + times.children_user + times.children_system
+    try:
+        tick = os.sysconf("SC_CLK_TCK")
+        me = str(os.getpid())
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            if fields[1] == me:
+                total += (int(fields[11]) + int(fields[12])) / tick
+    except Exception:
+        pass
+    return total
+
+def sample_cpu_percent() -> float:
+    """
+    Average CPU % (100 = one core) since the previous sample.
+    """
+    now = time.monotonic()
+    cpu = process_cpu_seconds()
+    wall = now - _cpu_sample["wall"]
+    used = cpu - _cpu_sample["cpu"]
+    _cpu_sample.update(wall=now, cpu=cpu)
+    return max(0.0, used / wall * 100) if wall > 0 else 0.0
+
+render_stats = {"count": 0, "total_ms": 0.0, "last_ms": 0.0, "total_bytes": 0, "last_bytes": 0, "peak_decode_bytes": 0}
+
+def _image_bytes(image: Image.Image) -> int:
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+def _load_render_base(src_path: str) -> Image.Image:
+    """
+    Decode close to the card size: JPEG draft() scales in the decoder,
+    reduce() handles the rest, then one shared RGB base covering 1280x720.
+    """
+    target_w, target_h = THUMB_SIZE
+    image = Image.open(src_path)
+    if image.format == "JPEG":
+        image.draft("RGB", THUMB_SIZE)
+    factor = min(image.size[0] // target_w, image.size[1] // target_h)
+    if factor >= 2:
+        image = image.reduce(factor)
+    image = image.convert("RGB")
+    scale = max(target_w / image.size[0], target_h / image.size[1])
+    if scale < 1:
+        size = (max(target_w, round(image.size[0] * scale)), max(target_h, round(image.size[1] * scale)))
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+def _render_thumbnail_sync(src_path: str, out_key: str, title: str) -> str:
+    started = time.perf_counter()
+    base = _load_render_base(src_path)
+    peak = _image_bytes(base)
+    try:
+        background = ImageOps.fit(base, THUMB_SIZE, centering=(0.5, 0.5))
+    except Exception:
+        background = base.resize(THUMB_SIZE, Image.LANCZOS)
+    background = background.filter(ImageFilter.BoxBlur(6))
+    enhancer = ImageEnhance.Brightness(background)
+    background = enhancer.enhance(0.85)
+    art = _create_circular_artwork(base, diameter=THUMB_ART_DIAMETER, border=10)
+    peak += _image_bytes(background) + _image_bytes(art)
+    art_x = 60
+    art_y = (THUMB_SIZE[1] - art.size[1]) // 2
+    background.paste(art, (art_x, art_y), art)
+    draw = ImageDraw.Draw(background)
+    try:
+        title_font = ImageFont.truetype("arial.ttf", 48)
+        small_font = ImageFont.truetype("arial.ttf", 18)
+    except Exception:
+        title_font = ImageFont.load_default()
+        small_font = ImageFont.load_default()
+    draw.text((20, 20), "DLK DEVELOPER", fill="white", font=small_font)
+    title_x = art_x + art.size[0] + 30
+    title_y = art_y + 30
+    shadow_color = (0, 0, 0)
+    for dx, dy in ((1, 1), (2, 2)):
+        draw.text((title_x+dx, title_y+dy), clear_title(title), fill=shadow_color, font=title_font)
+    draw.text((title_x, title_y), clear_title(title), fill="white", font=title_font)
+    if THUMB_FORMAT == "webp":
+        out_path = os.path.join(THUMB_CACHE_DIR, f"{out_key}.webp")
+        background.save(out_path, "WEBP", quality=THUMB_QUALITY, method=4)
+    else:
+        out_path = os.path.join(THUMB_CACHE_DIR, f"{out_key}.jpg")
+        background.save(out_path, "JPEG", quality=THUMB_QUALITY, optimize=True, progressive=True)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    out_bytes = os.path.getsize(out_path)
+    render_stats["count"] += 1
+    render_stats["total_ms"] += elapsed_ms
+    render_stats["last_ms"] = elapsed_ms
+    render_stats["total_bytes"] += out_bytes
+    render_stats["last_bytes"] = out_bytes
+    render_stats["peak_decode_bytes"] = max(render_stats["peak_decode_bytes"], peak)
+    logging.debug(f"thumbnail {out_key}: {elapsed_ms:.1f} ms, ~{peak // 1024} KiB decoded, {out_bytes} bytes out")
+    return out_path
+
 async def _process_image_and_overlay(src_path: str, out_key: str, title: str) -> Optional[str]:
     try:
-        image = Image.open(src_path).convert("RGBA")
-        try:
-            background = ImageOps.fit(image, (1280, 720), centering=(0.5, 0.5)).convert("RGBA")
-        except Exception:
-            background = image.resize((1280, 720), Image.LANCZOS).convert("RGBA")
-        background = background.filter(ImageFilter.BoxBlur(6))
-        enhancer = ImageEnhance.Brightness(background)
-        background = enhancer.enhance(0.85)
-        art = _create_circular_artwork(image, diameter=520, border=10)
-        art_x = 60
-        art_y = (720 - art.size[1]) // 2
-        background.paste(art, (art_x, art_y), art)
-        draw = ImageDraw.Draw(background)
-        try:
-            title_font = ImageFont.truetype("arial.ttf", 48)
-            small_font = ImageFont.truetype("arial.ttf", 18)
-        except Exception:
-            title_font = ImageFont.load_default()
-            small_font = ImageFont.load_default()
-        draw.text((20, 20), "DLK DEVELOPER", fill="white", font=small_font)
-        title_x = art_x + art.size[0] + 30
-        title_y = art_y + 30
-        shadow_color = (0, 0, 0, 200)
-        for dx, dy in ((1, 1), (2, 2)):
-            draw.text((title_x+dx, title_y+dy), clear_title(title), fill=shadow_color, font=title_font)
-        draw.text((title_x, title_y), clear_title(title), fill="white", font=title_font)
-        out_path = os.path.join(THUMB_CACHE_DIR, f"{out_key}.png")
-        background.save(out_path)
-        return out_path
+        return await asyncio.to_thread(_render_thumbnail_sync, src_path, out_key, title)
     except Exception as e:
         logging.debug(f"_process_image_and_overlay failed: {e}")
         return None
 
+def _thumb_key(source: str) -> str:
+    digest = hashlib.sha1(source.encode("utf-8", "ignore")).hexdigest()[:10]
+    return re.sub(r"[^0-9A-Za-z_-]", "_", source)[-28:].strip("_") + "_" + digest
+
+async def _fetch_and_render(thumbnail_url: str, key: str, title: str) -> Optional[str]:
+    tmp = os.path.join(THUMB_CACHE_DIR, f"tmp_{key}")
+    downloaded = await single_flight("download", thumbnail_url, lambda: _download_file(thumbnail_url, tmp))
+    if not downloaded:
+        return None
+    processed = await _process_image_and_overlay(downloaded, key, title)
+    try:
+        os.remove(downloaded)
+    except Exception:
+        pass
+    return processed
+
 async def get_thumb_from_url_or_webpage(thumbnail_url: Optional[str], webpage: Optional[str], title: str) -> Optional[str]:
     if thumbnail_url:
         if os.path.isfile(thumbnail_url):
-            key = re.sub(r"[^0-9A-Za-z_-]", "_", os.path.basename(thumbnail_url))[:40]
-            return await _process_image_and_overlay(thumbnail_url, key, title)
+            key = _thumb_key(os.path.basename(thumbnail_url))
+            return await single_flight(
+                "render", key, lambda: _process_image_and_overlay(thumbnail_url, key, title)
+            )
         if thumbnail_url.startswith("http"):
-            key = re.sub(r"[^0-9A-Za-z_-]", "_", thumbnail_url)[:40]
-            tmp = os.path.join(THUMB_CACHE_DIR, f"tmp_{key}")
-            downloaded = await _download_file(thumbnail_url, tmp)
-            if downloaded:
-                processed = await _process_image_and_overlay(downloaded, key, title)
-                try:
-                    os.remove(downloaded)
-                except Exception:
-                    pass
-                return processed
+            key = _thumb_key(thumbnail_url)
+            return await single_flight("render", key, lambda: _fetch_and_render(thumbnail_url, key, title))
     if webpage:
-        vid_id = get_youtube_id(webpage) or re.sub(r"[^0-9A-Za-z_-]", "_", webpage)[:40]
-        if VIDEOS_SEARCH_AVAILABLE and vid_id:
-            try:
-                url = f"https://www.youtube.com/watch?v={vid_id}"
-                results = VideosSearch(url, limit=1)
-                data = await results.next()
-                entries = data.get("result", [])
-                if entries:
-                    thumb = entries[0].get("thumbnails", [{}])[0].get("url", "").split("?")[0]
-                    if thumb:
-                        return await get_thumb_from_url_or_webpage(thumb, None, title)
-            except Exception:
-                pass
-        if youtube_dl is not None and vid_id:
-            try:
-                ydl_opts = {"quiet": True, "no_warnings": True, "skip_download": True}
-                if YT_DLP_COOKIES and os.path.isfile(YT_DLP_COOKIES):
-                    ydl_opts["cookiefile"] = YT_DLP_COOKIES
-                with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(f"https://www.youtube.com/watch?v={vid_id}", download=False)
-                    thumb = info.get("thumbnail")
-                    if thumb:
-                        return await get_thumb_from_url_or_webpage(thumb, None, title)
-            except Exception:
-                pass
+        vid_id = get_youtube_id(webpage)
+        if vid_id:
+            return await get_thumb_from_url_or_webpage(youtube_thumb_url(vid_id), None, title)
     return None
 
 # ---------- DB / LOG ----------
@@ -615,6 +1464,10 @@ def init_db_sync():
     db.blocked.create_index("chat_id")
     db.logs.create_index("ts")
     db.langs.create_index("chat_id", unique=True)
+    db.quality.create_index("chat_id", unique=True)
+    db.assistants.create_index("chat_id", unique=True)
+    db.queues.create_index("chat_id", unique=True)
+    db.track_stats.create_index("video_id", unique=True)
     logging.info(f"Connected to MongoDB: {MONGO_DBNAME}")
 
 def _valid_log_target(lid: str) -> bool:
@@ -636,7 +1489,11 @@ def log_event_sync(event_type: str, data: dict):
         logging.warning(f"Failed to write log to DB: {e}")
     if not LOG_CHANNEL_ID or not _valid_log_target(LOG_CHANNEL_ID):
         return
+    if shed_level >= 1 or time.time() < health["flood_until"]:
+        health["logs_dropped"] += 1
+        return
     async def _send():
+        health["log_backlog"] += 1
         try:
             target = LOG_CHANNEL_ID
             if not target.startswith("@"):
@@ -646,8 +1503,12 @@ def log_event_sync(event_type: str, data: dict):
                 f"🔔 <b>{event_type}</b>\n<pre>{data}</pre>",
                 disable_web_page_preview=True,
             )
+        except FloodWait as e:
+            logging.warning(f"Log channel FloodWait {note_outbound_flood(e)}s")
         except Exception as e:
             logging.warning(f"Failed to send log to channel {LOG_CHANNEL_ID}: {e}")
+        finally:
+            health["log_backlog"] -= 1
     try:
         loop = asyncio.get_running_loop()
         loop.create_task(_send())
@@ -711,59 +1572,344 @@ async def dlk_privilege_validator(subject: Union[Message, CallbackQuery]) -> boo
         logging.warning(f"Privilege check failed: {e}")
         return False
 
-# ---------- UI ----------
-def radio_buttons(page: int = 0, per_page: int = 6):
-    stations = sorted(RADIO_STATION.keys())
-    total_pages = (len(stations) - 1) // per_page + 1
-    start = page * per_page
-    end = start + per_page
-    current = stations[start:end]
-    buttons = []
-    for i in range(0, len(current), 2):
-        row = [InlineKeyboardButton(current[i], callback_data=f"radio_play_{current[i]}")]
-        if i + 1 < len(current):
-            row.append(InlineKeyboardButton(current[i+1], callback_data=f"radio_play_{current[i+1]}"))
-        buttons.append(row)
-    nav = []
-    if page > 0:
-        nav.append(InlineKeyboardButton("◁", callback_data=f"radio_page_{page-1}"))
-    if page < total_pages - 1:
-        nav.append(InlineKeyboardButton("▷", callback_data=f"radio_page_{page+1}"))
-    if nav:
-        buttons.append(nav)
-    buttons.append([InlineKeyboardButton("❌ Close Menu", callback_data="radio_close")])
-    return InlineKeyboardMarkup(buttons)
+# ---------- STREAM RESOLVER ----------
+class StreamResolveError(Exception):
+    pass
 
-def player_controls_markup(chat_id: int):
-    if chat_id in radio_paused:
-        controls = [
-            InlineKeyboardButton("▷", callback_data="radio_resume"),
-            InlineKeyboardButton("‣‣I", callback_data="music_skip"),
-            InlineKeyboardButton("▢", callback_data="radio_stop"),
-        ]
+PLS_TYPES = ("audio/x-scpls", "application/pls+xml")
+M3U_TYPES = ("audio/x-mpegurl", "audio/mpegurl", "application/x-mpegurl", "application/vnd.apple.mpegurl")
+_resolved_streams: Dict[str, Tuple[str, float]] = {}  # url -> (final direct url, expires), oldest first
+_tls_skip_hosts = set(RADIO_TLS_SKIP_HOSTS)
+
+def radio_ssl(url: str) -> bool:
+    """
+    ssl= for a station fetch: False only when verification is turned off
+    globally or for the URL's host.
+    """
+    return RADIO_VERIFY_TLS and (urlparse(url).hostname or "").lower() not in _tls_skip_hosts
+
+def skip_tls_for(url: str):
+    host = (urlparse(url).hostname or "").lower()
+    if host:
+        _tls_skip_hosts.add(host)
+
+def _playlist_targets(body: str, base: str) -> List[str]:
+    if body.lstrip().lower().startswith("[playlist]"):
+        found = re.findall(r"^\s*File\d+\s*=\s*(\S+)", body, re.IGNORECASE | re.MULTILINE)
     else:
-        controls = [
-            InlineKeyboardButton("II", callback_data="radio_pause"),
-            InlineKeyboardButton("‣‣I", callback_data="music_skip"),
-            InlineKeyboardButton("▢", callback_data="radio_stop"),
-        ]
-    bottom = [
-        InlineKeyboardButton("👨‍💻 Dev", url=DEV_LINK),
-        InlineKeyboardButton("💬 Support", url=SUPPORT_LINK),
-    ]
-    return InlineKeyboardMarkup([controls, bottom])
+        found = [ln.strip() for ln in body.splitlines() if ln.strip() and not ln.startswith("#")]
+    return [urljoin(base, u) for u in found]
 
-# ---------- TIMER / VC HELPERS ----------
-async def update_radio_timer(chat_id: int, msg_id: int, title: str, start_time: float, track_duration: int):
+async def _resolve_stream(url: str, depth: int, ssl: bool = True) -> str:
+    if depth > 4:
+        raise StreamResolveError("too many playlist levels")
+    timeout = aiohttp.ClientTimeout(total=RADIO_PROBE_TIMEOUT)
+    ssl = ssl and radio_ssl(url)  # an opted-out station's playlist targets stay opted out
+    try:
+        async with get_http_session().get(url, ssl=ssl, timeout=timeout) as resp:
+            if resp.status >= 400:
+                raise StreamResolveError(f"HTTP {resp.status}")
+            final = str(resp.url)
+            ctype = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            path = urlparse(final).path.lower()
+            head = await resp.content.read(2048)
+            if not head:
+                raise StreamResolveError("empty response")
+            sniff = head.lstrip()[:16].lower()
+            is_playlist = (
+                ctype in PLS_TYPES or ctype in M3U_TYPES
+                or path.endswith((".pls", ".m3u", ".m3u8"))
+                or sniff.startswith((b"[playlist]", b"#extm3u"))
+            )
+            if not is_playlist:
+                return final
+            body = (head + await resp.content.read(64 * 1024)).decode("utf-8", "ignore")
+    except StreamResolveError:
+        raise
+    except Exception as e:
+        raise StreamResolveError(str(e) or type(e).__name__)
+    if "#EXT-X-" in body:
+        # HLS: ffmpeg plays media playlists itself; unwrap a master to its first variant
+        if "#EXT-X-STREAM-INF" not in body:
+            if "#EXTINF" not in body:
+                raise StreamResolveError("HLS playlist without segments")
+            return final
+        variants = _playlist_targets(body, final)
+        if not variants:
+            raise StreamResolveError("HLS master without variants")
+        return await _resolve_stream(variants[0], depth + 1, ssl)
+    targets = _playlist_targets(body, final)
+    if not targets:
+        raise StreamResolveError("empty playlist")
+    last_error = None
+    for target in targets[:3]:
+        try:
+            return await _resolve_stream(target, depth + 1, ssl)
+        except StreamResolveError as e:
+            last_error = e
+    raise last_error
+
+async def resolve_stream_url(url: str) -> str:
     """
-    Simple countdown for ONE song.
+    Follow redirects and unwrap .pls/.m3u/HLS-master wrappers to the direct
+    media URL, cached for STREAM_RESOLVE_TTL. Raises StreamResolveError.
     """
+    cached = _resolved_streams.get(url)
+    if cached and cached[1] > time.time():
+        return cached[0]
+    final = await single_flight("stream", url, lambda: _resolve_stream(url, 0))
+    if not radio_ssl(url):
+        skip_tls_for(final)
+    now = time.time()
+    _resolved_streams.pop(url, None)
+    if len(_resolved_streams) >= STREAM_RESOLVE_MAX:
+        # /rpush takes any URL: drop expired entries, then the oldest
+        for key in [k for k, (_, expires) in _resolved_streams.items() if expires <= now]:
+            del _resolved_streams[key]
+        while len(_resolved_streams) >= STREAM_RESOLVE_MAX:
+            del _resolved_streams[next(iter(_resolved_streams))]
+    _resolved_streams[url] = (final, now + STREAM_RESOLVE_TTL)
+    return final
+
+# ---------- STATION HEALTH ----------
+station_health: Dict[str, Dict[str, Any]] = {}  # name -> {"ok", "failures", "ttfb", "content_type", "bitrate", "checked", "error"}
+
+async def probe_station(name: str, url: str):
+    started = time.monotonic()
+    result = {"ok": False, "ttfb": None, "content_type": None, "bitrate": None, "checked": time.time(), "error": None}
+    try:
+        _resolved_streams.pop(url, None)
+        url = await resolve_stream_url(url)
+        timeout = aiohttp.ClientTimeout(total=RADIO_PROBE_TIMEOUT)
+        async with get_http_session().get(url, ssl=radio_ssl(url), timeout=timeout) as resp:
+            result["content_type"] = resp.headers.get("Content-Type")
+            result["bitrate"] = resp.headers.get("icy-br")
+            if resp.status != 200:
+                result["error"] = f"HTTP {resp.status}"
+            else:
+                first = await resp.content.read(1024)
+                result["ttfb"] = time.monotonic() - started
+                result["ok"] = bool(first)
+                if not first:
+                    result["error"] = "no data"
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    previous = station_health.get(name)
+    result["failures"] = 0 if result["ok"] else (previous["failures"] if previous else 0) + 1
+    station_health[name] = result
+
+async def probe_all_stations():
+    slots = asyncio.Semaphore(RADIO_PROBE_CONCURRENCY)
+
+    async def _probe(name: str, url: str):
+        async with slots:
+            await probe_station(name, url)
+
+    before = {n for n in station_health if station_is_dead(n)}
+    await asyncio.gather(*(_probe(n, u) for n, u in list(station_catalog.urls.items())))
+    dead = [n for n in station_health if station_is_dead(n)]
+    logging.info(f"Radio probe: {len(station_health) - len(dead)} up, {len(dead)} down {dead}")
+    if set(dead) != before:
+        station_catalog.build_pages()
+
+async def radio_probe_loop():
     while True:
         try:
-            elapsed = max(0, int(time.time() - start_time))
-            remaining = max(0, track_duration - elapsed)
-            m, s = divmod(remaining, 60)
-            timer = f"{m:02d}:{s:02d}"
+            await probe_all_stations()
+        except Exception as e:
+            logging.warning(f"radio probe cycle failed: {e}")
+        await asyncio.sleep(RADIO_PROBE_INTERVAL)
+
+def station_is_dead(name: str) -> bool:
+    """
+    Dead after RADIO_DEAD_AFTER failed probes in a row, so one timeout
+    or upstream 5xx doesn't hide a station for a whole probe interval.
+    """
+    health = station_health.get(name)
+    return health is not None and health["failures"] >= RADIO_DEAD_AFTER
+
+async def station_available(name: str, url: str) -> bool:
+    """
+    Stations marked dead get one fresh probe when a user picks them.
+    """
+    if not station_is_dead(name):
+        return True
+    await single_flight("probe", name, lambda: probe_station(name, url))
+    if station_is_dead(name):
+        return False
+    station_catalog.build_pages()
+    return True
+
+def stations_by_latency() -> List[str]:
+    alive = [(h["ttfb"], n) for n, h in station_health.items() if h["ok"] and h["ttfb"] is not None]
+    return [n for _, n in sorted(alive)]
+
+# ---------- STATION CATALOG ----------
+STATION_PREFIX_MAX = 12
+STATION_PREFIX_HITS = 8
+
+def _norm_station(text: str) -> str:
+    return re.sub(r"[^0-9a-z\u0080-\uffff]+", "", (text or "").lower())
+
+class StationCatalog:
+    """
+    Stations with pre-built, immutable menu pages and an index over
+    names and aliases: exact and prefix lookups are dict hits, fuzzy
+    matching only runs when those miss.
+    """
+
+    def __init__(self, urls: Dict[str, str], aliases: Optional[Dict[str, List[str]]] = None, per_page: int = 6):
+        self.urls = dict(urls)
+        self.aliases = {k: list(v) for k, v in (aliases or {}).items() if k in self.urls}
+        self.per_page = per_page
+        self.names: Tuple[str, ...] = tuple(sorted(self.urls))
+        self._ids = {name: i for i, name in enumerate(self.names)}
+        self._exact: Dict[str, str] = {}
+        self._prefix: Dict[str, Tuple[str, ...]] = {}
+        self.pages: Tuple[InlineKeyboardMarkup, ...] = ()
+        self._build_index()
+        self.build_pages()
+
+    def _build_index(self):
+        prefix: Dict[str, List[str]] = {}
+        for name in self.names:
+            keys = [name] + self.aliases.get(name, [])
+            for key in keys:
+                self._exact.setdefault(_norm_station(key), name)
+            words = {_norm_station(w) for key in keys for w in [key] + key.split()}
+            for word in words:
+                for i in range(1, min(len(word), STATION_PREFIX_MAX) + 1):
+                    hits = prefix.setdefault(word[:i], [])
+                    if name not in hits and len(hits) < STATION_PREFIX_HITS:
+                        hits.append(name)
+        self._prefix = {k: tuple(v) for k, v in prefix.items()}
+
+    def callback_data(self, name: str) -> str:
+        data = f"radio_play_{name}"
+        return data if len(data.encode("utf-8")) <= 64 else f"radio_play_#{self._ids[name]}"
+
+    def from_callback(self, token: str) -> Optional[str]:
+        if token.startswith("#") and token[1:].isdigit():
+            idx = int(token[1:])
+            return self.names[idx] if idx < len(self.names) else None
+        return token if token in self.urls else None
+
+    def _button(self, name: str) -> InlineKeyboardButton:
+        label = f"📴 {name}" if station_is_dead(name) else name
+        return InlineKeyboardButton(label, callback_data=self.callback_data(name))
+
+    def keyboard(self, names: List[str], nav: Optional[List[InlineKeyboardButton]] = None) -> InlineKeyboardMarkup:
+        buttons = [[self._button(n) for n in names[i:i + 2]] for i in range(0, len(names), 2)]
+        if nav:
+            buttons.append(nav)
+        buttons.append([InlineKeyboardButton("❌ Close Menu", callback_data="radio_close")])
+        return InlineKeyboardMarkup(buttons)
+
+    def build_pages(self):
+        names = [n for n in self.names if not (RADIO_HIDE_DEAD and station_is_dead(n))]
+        total_pages = max(1, (len(names) - 1) // self.per_page + 1)
+        pages = []
+        for page in range(total_pages):
+            nav = []
+            if page > 0:
+                nav.append(InlineKeyboardButton("◁", callback_data=f"radio_page_{page-1}"))
+            if page < total_pages - 1:
+                nav.append(InlineKeyboardButton("▷", callback_data=f"radio_page_{page+1}"))
+            current = names[page * self.per_page:(page + 1) * self.per_page]
+            pages.append(self.keyboard(current, nav))
+        self.pages = tuple(pages)
+
+    def page(self, page: int) -> InlineKeyboardMarkup:
+        return self.pages[max(0, min(page, len(self.pages) - 1))]
+
+    def lookup(self, query: str) -> Optional[str]:
+        if query in self.urls:
+            return query
+        return self._exact.get(_norm_station(query))
+
+    def search(self, query: str, limit: int = 6) -> List[str]:
+        exact = self.lookup(query)
+        if exact:
+            return [exact]
+        key = _norm_station(query)
+        if not key:
+            return []
+        hits = self._prefix.get(key[:STATION_PREFIX_MAX])
+        if hits:
+            return list(hits[:limit])
+        close = difflib.get_close_matches(key, list(self._exact), n=limit, cutoff=0.6)
+        return list(dict.fromkeys(self._exact[c] for c in close))
+
+station_catalog = StationCatalog(RADIO_STATION)
+
+def load_station_catalog():
+    """
+    Built-in stations, then RADIO_STATIONS_FILE, then db.stations.
+    """
+    global station_catalog
+    urls = dict(RADIO_STATION)
+    aliases: Dict[str, List[str]] = {}
+
+    def _merge(items):
+        if isinstance(items, dict):
+            items = [{"name": k, "url": v} for k, v in items.items()]
+        for item in items or []:
+            name, url = item.get("name"), item.get("url")
+            if name and url:
+                urls[name] = url
+                if item.get("verify_tls") is False:
+                    skip_tls_for(url)
+                if item.get("aliases"):
+                    aliases[name] = list(item["aliases"])
+
+    if RADIO_STATIONS_FILE:
+        try:
+            with open(RADIO_STATIONS_FILE, encoding="utf-8") as f:
+                _merge(json.load(f))
+        except Exception as e:
+            logging.warning(f"Failed to load {RADIO_STATIONS_FILE}: {e}")
+    if db is not None:
+        try:
+            _merge(list(db.stations.find({}, {"_id": 0})))
+        except Exception as e:
+            logging.warning(f"Failed to load stations from DB: {e}")
+    station_catalog = StationCatalog(urls, aliases)
+    logging.info(f"Station catalog: {len(station_catalog.names)} stations, {len(station_catalog.pages)} pages")
+
+# ---------- UI ----------
+def radio_buttons(page: int = 0):
+    return station_catalog.page(page)
+
+def player_controls_markup(chat_id: int):
+    if chat_id in radio_paused:
+        controls = [
+            InlineKeyboardButton("▷", callback_data="radio_resume"),
+            InlineKeyboardButton("‣‣I", callback_data="music_skip"),
+            InlineKeyboardButton("▢", callback_data="radio_stop"),
+        ]
+    else:
+        controls = [
+            InlineKeyboardButton("II", callback_data="radio_pause"),
+            InlineKeyboardButton("‣‣I", callback_data="music_skip"),
+            InlineKeyboardButton("▢", callback_data="radio_stop"),
+        ]
+    bottom = [
+        InlineKeyboardButton("👨‍💻 Dev", url=DEV_LINK),
+        InlineKeyboardButton("💬 Support", url=SUPPORT_LINK),
+    ]
+    return InlineKeyboardMarkup([controls, bottom])
+
+# ---------- TIMER / VC HELPERS ----------
+async def update_radio_timer(chat_id: int, msg_id: int, title: str, start_time: float, track_duration: int):
+    """
+    Simple countdown for ONE song.
+    """
+    while True:
+        try:
+            elapsed = max(0, int(time.time() - start_time))
+            remaining = max(0, track_duration - elapsed)
+            m, s = divmod(remaining, 60)
+            timer = f"{m:02d}:{s:02d}"
             caption = f"🎧 Now Playing: {title}\n⏳ Duration: {timer}"
             await bot.edit_message_caption(
                 chat_id=chat_id,
@@ -773,16 +1919,336 @@ async def update_radio_timer(chat_id: int, msg_id: int, title: str, start_time:
             )
             if remaining <= 0:
                 break
+        except FloodWait as e:
+            await asyncio.sleep(note_outbound_flood(e))
+            continue
         except Exception as e:
             logging.debug(f"Timer update failed for {chat_id}/{msg_id}: {e}")
             break
-        await asyncio.sleep(5)
+        await asyncio.sleep(5 * SHED_TIMER_STRETCH[shed_level])
+
+# ---------- ASSISTANT POOL ----------
+chat_assistant: Dict[int, int] = {}  # chat_id -> assistants index (sticky)
+
+def _slot_by_user_id(user_id: Optional[int]) -> Optional[AssistantSlot]:
+    for slot in assistants:
+        if user_id is not None and slot.id == user_id:
+            return slot
+    return None
+
+def _load_chat_assistant(chat_id: int) -> Optional[AssistantSlot]:
+    try:
+        if db is None:
+            return None
+        row = db.assistants.find_one({"chat_id": chat_id})
+        return _slot_by_user_id((row or {}).get("assistant_id"))
+    except Exception:
+        return None
+
+def _save_chat_assistant(chat_id: int, slot: AssistantSlot):
+    if db is None or slot.id is None:
+        return
+    try:
+        db.assistants.update_one(
+            {"chat_id": chat_id},
+            {"$set": {"chat_id": chat_id, "assistant_id": slot.id, "ts": time.time()}},
+            upsert=True,
+        )
+    except Exception as e:
+        logging.warning(f"Failed to store assistant for chat {chat_id}: {e}")
+
+def bound_assistant(chat_id: int) -> AssistantSlot:
+    """
+    The assistant that owns (or last owned) this chat's call.
+    """
+    idx = chat_assistant.get(chat_id)
+    if idx is None:
+        slot = _load_chat_assistant(chat_id)
+        if slot is not None:
+            chat_assistant[chat_id] = slot.index
+            return slot
+        return assistants[0]
+    return assistants[idx]
+
+def pick_assistant(exclude: Tuple[int, ...] = ()) -> Optional[AssistantSlot]:
+    candidates = [s for s in assistants if s.available() and s.index not in exclude]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda s: (s.full(), s.load(), s.index))
+
+def assistant_for(chat_id: int) -> AssistantSlot:
+    """
+    Sticky placement: keep the chat's assistant while it is usable,
+    otherwise move the chat to the least loaded one.
+    """
+    current = bound_assistant(chat_id)
+    if (
+        current.available()
+        and (chat_id in current.chats or not current.full() or len(assistants) == 1)
+        and (chat_id in chat_assistant or chat_id in current.chats or len(assistants) == 1)
+    ):
+        chat_assistant[chat_id] = current.index
+        return current
+    slot = pick_assistant() or current
+    if chat_assistant.get(chat_id) != slot.index:
+        chat_assistant[chat_id] = slot.index
+        _save_chat_assistant(chat_id, slot)
+    return slot
+
+def note_assistant_flood(slot: AssistantSlot, e: FloodWait):
+    wait = getattr(e, "value", None) or getattr(e, "x", None) or 60
+    slot.floods.append(time.time())
+    slot.flood_until = max(slot.flood_until, time.time() + int(wait))
+    logging.warning(f"Assistant #{slot.index} FloodWait {wait}s")
+
+def note_assistant_dead(slot: AssistantSlot, e: Exception):
+    slot.dead = True
+    logging.error(f"Assistant #{slot.index} disabled: {e}")
+
+class AssistantJoinError(Exception):
+    def __init__(self, message: str, invite_link: Optional[str] = None):
+        super().__init__(message)
+        self.invite_link = invite_link
+
+async def _join_assistant(slot: AssistantSlot, chat_id: int) -> bool:
+    """
+    Make sure the assistant is a member; True if it had to join.
+    Raises when it is not in the chat and cannot join.
+    """
+    if slot.id is None:
+        me = await slot.client.get_me()
+        slot.id, slot.username = me.id, me.username
+    try:
+        await slot.client.get_chat_member(chat_id, slot.id)
+        return False
+    except FloodWait:
+        raise
+    except RPCError as e:
+        if ACCOUNT_DEAD_ERRORS and isinstance(e, ACCOUNT_DEAD_ERRORS):
+            raise
+    try:
+        invite = await bot.create_chat_invite_link(chat_id, member_limit=1, name="DLK BOT assistant")
+    except Exception as e:
+        raise AssistantJoinError(str(e)) from e
+    try:
+        await slot.client.join_chat(invite.invite_link)
+    except FloodWait:
+        raise
+    except Exception as e:
+        if ACCOUNT_DEAD_ERRORS and isinstance(e, ACCOUNT_DEAD_ERRORS):
+            raise
+        raise AssistantJoinError(str(e), invite.invite_link) from e
+    return True
+
+async def ensure_assistant(chat_id: int, reply_to: Message) -> Optional[AssistantSlot]:
+    """
+    Pick the chat's assistant and get it into the group, failing over to
+    the next one on FloodWait or a ban. Replies to the user and returns
+    None when no assistant could get in.
+    """
+    tried: Tuple[int, ...] = ()
+    slot = assistant_for(chat_id)
+    invite_link = None
+    while slot is not None and slot.index not in tried:
+        tried += (slot.index,)
+        try:
+            if await _join_assistant(slot, chat_id):
+                try:
+                    await bot.send_message(chat_id, t(chat_id, "ASSISTANT_JOIN_INFO"), disable_web_page_preview=True)
+                except Exception:
+                    pass
+            if chat_assistant.get(chat_id) != slot.index:
+                chat_assistant[chat_id] = slot.index
+                _save_chat_assistant(chat_id, slot)
+            touch_chat(chat_id)
+            return slot
+        except FloodWait as e:
+            note_assistant_flood(slot, e)
+        except Exception as e:
+            if ACCOUNT_DEAD_ERRORS and isinstance(e, ACCOUNT_DEAD_ERRORS):
+                note_assistant_dead(slot, e)
+            if isinstance(e, AssistantJoinError):
+                invite_link = e.invite_link or invite_link
+            logging.warning(f"Assistant #{slot.index} cannot join {chat_id}: {e}")
+        slot = pick_assistant(exclude=tried)
+    if invite_link:
+        help_kb = InlineKeyboardMarkup([
+            [InlineKeyboardButton("📋 Invite Link", url=invite_link)],
+            [InlineKeyboardButton("ℹ️ How to add assistant", callback_data="assistant_invite_help")],
+            [InlineKeyboardButton("❌ Dismiss", callback_data="radio_close")],
+        ])
+        await reply_to.reply_text(t(chat_id, "ASSISTANT_INVITE_TEXT"), reply_markup=help_kb)
+    else:
+        await reply_to.reply_text(t(chat_id, "ASSISTANT_INVITE_FAIL_TEXT"))
+    return None
+
+async def assistant_play(chat_id: int, stream: MediaStream) -> AssistantSlot:
+    """
+    Play on the chat's assistant; on FloodWait or a ban move the call
+    to another assistant. Re-raises when none is left.
+    """
+    tried: Tuple[int, ...] = ()
+    slot = assistant_for(chat_id)
+    while True:
+        tried += (slot.index,)
+        try:
+            await slot.calls.play(chat_id, stream)
+            for other in assistants:
+                if other is not slot and chat_id in other.chats:
+                    other.chats.discard(chat_id)
+                    try:
+                        await other.calls.leave_group_call(chat_id)
+                    except Exception as e:
+                        logging.debug(f"Old assistant #{other.index} leave {chat_id} failed: {e}")
+            slot.chats.add(chat_id)
+            return slot
+        except FloodWait as e:
+            note_assistant_flood(slot, e)
+            error: Exception = e
+        except Exception as e:
+            if ACCOUNT_DEAD_ERRORS and isinstance(e, ACCOUNT_DEAD_ERRORS):
+                note_assistant_dead(slot, e)
+            elif not (CHAT_BAN_ERRORS and isinstance(e, CHAT_BAN_ERRORS)):
+                raise
+            error = e
+        while True:
+            nxt = pick_assistant(exclude=tried)
+            if nxt is None:
+                raise error
+            try:
+                await _join_assistant(nxt, chat_id)
+                break
+            except Exception as e:
+                logging.debug(f"Failover join #{nxt.index} -> {chat_id} failed: {e}")
+                tried += (nxt.index,)
+        logging.info(f"Failing {chat_id} over from assistant #{slot.index} to #{nxt.index}")
+        chat_assistant[chat_id] = nxt.index
+        _save_chat_assistant(chat_id, nxt)
+        slot = nxt
+
+# ---------- CALL BUDGET ----------
+call_waiting: Dict[int, asyncio.Future] = {}   # chat_id -> admission future, FIFO by insertion
+call_reservations: Dict[int, float] = {}       # admitted chats not playing yet -> expiry
+CALL_RESERVATION_TTL = 120.0
+call_budget_stats = {"waited": 0, "rejected": 0, "timed_out": 0}
+
+def _live_reservations() -> int:
+    now = time.time()
+    for chat_id in [c for c, exp in call_reservations.items() if exp < now or c in radio_state]:
+        call_reservations.pop(chat_id, None)
+    return len(call_reservations)
+
+def call_capacity_free() -> bool:
+    reserved = _live_reservations()
+    if MAX_CALLS and len(radio_state) + reserved >= MAX_CALLS:
+        return False
+    if MAX_CALLS_PER_ASSISTANT:
+        free = sum(max(0, MAX_CALLS_PER_ASSISTANT - len(s.chats)) for s in assistants if s.available())
+        return free - reserved > 0
+    return True
+
+def estimate_call_wait(position: int) -> int:
+    """
+    Minutes until `position` slots free up, from the songs' remaining
+    time; live radio has no end, so the room timeout bounds the guess.
+    """
+    now = time.time()
+    remaining = sorted(
+        max(0.0, s.duration - (s.elapsed if s.paused else now - (s.start_time or now)))
+        for s in radio_state.values()
+        if s.duration is not None
+    )
+    seconds = remaining[position - 1] if len(remaining) >= position else WAITING_ROOM_TIMEOUT
+    return max(1, int(seconds // 60) + 1)
+
+def admit_waiting():
+    """
+    Hand freed slots to waiting chats in arrival order.
+    """
+    while call_waiting and call_capacity_free():
+        chat_id = next(iter(call_waiting))
+        fut = call_waiting.pop(chat_id)
+        if fut.done():
+            continue
+        call_reservations[chat_id] = time.time() + CALL_RESERVATION_TTL
+        fut.set_result(True)
+
+def reserve_call_slot(chat_id: int) -> bool:
+    """
+    True when the chat may start a call right now (it holds a reservation).
+    """
+    if chat_id in radio_state or chat_id in call_reservations:
+        return True
+    if not call_waiting and call_capacity_free():
+        call_reservations[chat_id] = time.time() + CALL_RESERVATION_TTL
+        return True
+    return False
+
+async def wait_for_call_slot(chat_id: int, notify) -> bool:
+    """
+    True once the chat may start a new call. Over budget, the chat waits
+    in line (notify() gets the localized position text) or is turned away
+    with an estimated wait when the room is full.
+    """
+    if reserve_call_slot(chat_id):
+        return True
+    fut = call_waiting.get(chat_id)
+    if fut is None:
+        if len(call_waiting) >= WAITING_ROOM_SIZE:
+            call_budget_stats["rejected"] += 1
+            await notify(t(chat_id, "CALLS_FULL", minutes=estimate_call_wait(len(call_waiting) + 1)))
+            return False
+        fut = call_waiting[chat_id] = asyncio.get_event_loop().create_future()
+        call_budget_stats["waited"] += 1
+        admit_waiting()
+        if fut.done():
+            return True
+    await notify(t(chat_id, "CALLS_WAITING", position=list(call_waiting).index(chat_id) + 1))
+    try:
+        return await asyncio.wait_for(asyncio.shield(fut), WAITING_ROOM_TIMEOUT)
+    except asyncio.TimeoutError:
+        if call_waiting.get(chat_id) is fut:
+            call_waiting.pop(chat_id, None)
+        call_budget_stats["timed_out"] += 1
+        await notify(t(chat_id, "CALLS_WAIT_TIMEOUT"))
+        return False
+
+def release_call_slot(chat_id: int):
+    call_reservations.pop(chat_id, None)
+    admit_waiting()
+
+_call_wait_tasks: set = set()  # detached waiting-room starts, kept referenced
+
+async def run_when_call_free(chat_id: int, notify, start, on_give_up=None):
+    """
+    Run start() now when a call slot is free. Otherwise return at once and
+    run it from a detached task when the waiting room admits the chat, so
+    waiting chats don't hold Pyrogram's handler workers (and /stop, which
+    frees slots, still gets through).
+    """
+    if reserve_call_slot(chat_id):
+        await start()
+        return
+
+    async def _wait():
+        try:
+            if await wait_for_call_slot(chat_id, notify):
+                await start()
+            elif on_give_up is not None:
+                on_give_up()
+        except Exception:
+            logging.error(f"Deferred call start failed for {chat_id}", exc_info=True)
+
+    task = asyncio.create_task(_wait())
+    _call_wait_tasks.add(task)
+    task.add_done_callback(_call_wait_tasks.discard)
 
 async def _safe_call_py_method(method_name: str, *args, **kwargs):
+    calls = bound_assistant(args[0]).calls if args else call_py
     try:
-        if not hasattr(call_py, method_name):
+        if not hasattr(calls, method_name):
             return None
-        attr = getattr(call_py, method_name)
+        attr = getattr(calls, method_name)
         if not callable(attr):
             return None
         result = attr(*args, **kwargs)
@@ -797,8 +2263,10 @@ async def _force_leave_call(chat_id: int):
     """
     Assistant voice call leave handle.
     """
+    slot = bound_assistant(chat_id)
+    slot.chats.discard(chat_id)
     try:
-        await call_py.leave_group_call(chat_id)
+        await slot.calls.leave_group_call(chat_id)
         logging.debug(f"_force_leave_call: leave_group_call used for {chat_id}")
     except Exception as e:
         logging.debug(f"_force_leave_call leave_group_call failed {chat_id}: {e}")
@@ -824,11 +2292,17 @@ async def leave_voice_chat(chat_id: int, cancel_watchers: bool = True):
             track_watchers.pop(chat_id, None)
         if chat_id in radio_paused:
             radio_paused.discard(chat_id)
+        release_state_media(chat_id)
         radio_state.pop(chat_id, None)
+        stop_radio_supervisor(chat_id)
+        _prefetched.pop(chat_id, None)
+        forget_listeners(chat_id)
+        touch_chat(chat_id)
         try:
             await _force_leave_call(chat_id)
         except Exception as e:
             logging.debug(f"force leave vc failed {chat_id}: {e}")
+        release_call_slot(chat_id)  # after slot.chats dropped the chat
     except Exception as e:
         logging.warning(f"leave_voice_chat failed {chat_id}: {e}")
 
@@ -841,21 +2315,966 @@ def store_play_state(
     elapsed: float = 0.0,
     paused: bool = False,
     duration: Optional[int] = None,
+    media_key: Optional[str] = None,
 ):
-    state = {
-        "chat_id": chat_id,
-        "station": title,
-        "url": url,
-        "msg_id": msg_id,
-        "start_time": start_time,
-        "elapsed": elapsed,
-        "paused": paused,
-        "duration": duration,
-        "ts": time.time(),
+    radio_state[chat_id] = PlaybackSession(
+        chat_id, title, url, msg_id, start_time, elapsed, paused, duration, media_key
+    )
+    call_reservations.pop(chat_id, None)
+    touch_chat(chat_id)
+
+# ---------- MEDIA STORE ----------
+class MediaStore:
+    """
+    Files in one directory with reference counts, a byte quota and LRU
+    eviction of files no queued or playing entry refers to.
+    """
+
+    def __init__(self, directory: str, quota_bytes: int, keep_prefix: Optional[str] = None):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.keep_prefix = keep_prefix  # files named like this survive restarts
+        self.files: Dict[str, Dict[str, Any]] = {}  # name -> {"size", "refs", "used", "pending"}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def total_bytes(self) -> int:
+        return sum(f["size"] for f in self.files.values())
+
+    def add(self, name: str, refs: int = 1, evict: bool = True):
+        try:
+            size = os.path.getsize(self.path(name))
+        except OSError:
+            return
+        f = self.files.get(name)
+        if f is not None:
+            refs = f["refs"]  # finishing a reserved download keeps its refs
+        self.files[name] = {"size": size, "refs": refs, "used": time.time(), "pending": False}
+        if evict:
+            self.evict()
+
+    def reserve(self, name: str, refs: int = 1):
+        """
+        Track a file that is still being written; never evicted meanwhile.
+        """
+        self.files[name] = {"size": 0, "refs": refs, "used": time.time(), "pending": True}
+
+    def discard(self, name: str):
+        self._remove(name)
+
+    def acquire(self, name: str) -> bool:
+        f = self.files.get(name)
+        if f is not None and f["pending"]:
+            f["refs"] += 1
+            return True
+        if f is None or not os.path.isfile(self.path(name)):
+            self.files.pop(name, None)
+            return False
+        f["refs"] += 1
+        f["used"] = time.time()
+        return True
+
+    def release(self, name: str):
+        f = self.files.get(name)
+        if f is None:
+            return
+        f["refs"] = max(0, f["refs"] - 1)
+        f["used"] = time.time()
+        self.evict()
+
+    def _remove(self, name: str):
+        self.files.pop(name, None)
+        try:
+            os.remove(self.path(name))
+        except OSError:
+            pass
+
+    def evict(self):
+        total = self.total_bytes()
+        if total <= self.quota_bytes:
+            return
+        idle = sorted(
+            (f["used"], name) for name, f in self.files.items() if f["refs"] <= 0 and not f["pending"]
+        )
+        for _, name in idle:
+            if total <= self.quota_bytes:
+                break
+            total -= self.files[name]["size"]
+            logging.debug(f"MediaStore: evicting {name}")
+            self._remove(name)
+
+    def sweep(self):
+        """
+        Startup: adopt reusable files as unreferenced, delete partial and
+        orphaned ones, then trim to quota.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name in self.files or not os.path.isfile(self.path(name)):
+                continue
+            reusable = (
+                self.keep_prefix is not None
+                and name.startswith(self.keep_prefix)
+                and not name.endswith((".part", ".temp"))
+            )
+            if reusable:
+                self.add(name, refs=0, evict=False)
+                self.files[name]["used"] = os.path.getmtime(self.path(name))
+            else:
+                self._remove(name)
+        self.evict()
+
+download_store = MediaStore(DOWNLOADS_DIR, DOWNLOADS_QUOTA_MB * 1024 * 1024, keep_prefix="tg_")
+
+audio_store = MediaStore(AUDIO_CACHE_DIR, AUDIO_CACHE_QUOTA_MB * 1024 * 1024, keep_prefix="yt_")
+
+def store_for_key(media_key: str) -> MediaStore:
+    return audio_store if media_key.startswith("yt_") else download_store
+
+def release_entry_media(entry: Optional[Dict[str, Any]]):
+    if entry and entry.get("media_key"):
+        store_for_key(entry["media_key"]).release(entry["media_key"])
+
+def release_state_media(chat_id: int):
+    state = radio_state.get(chat_id)
+    if state and state.media_key:
+        store_for_key(state.media_key).release(state.media_key)
+        state.media_key = None
+
+# ---------- QUEUES ----------
+def save_queue_sync(chat_id: int):
+    if db is None:
+        return
+    try:
+        q = radio_queue.get(chat_id) or []
+        if q:
+            db.queues.update_one(
+                {"chat_id": chat_id},
+                {"$set": {"chat_id": chat_id, "entries": q, "ts": time.time()}},
+                upsert=True,
+            )
+        else:
+            db.queues.delete_one({"chat_id": chat_id})
+    except Exception as e:
+        logging.warning(f"Failed to save queue for chat {chat_id}: {e}")
+
+def queue_push(chat_id: int, entry: Dict[str, Any]):
+    radio_queue.setdefault(chat_id, []).append(entry)
+    touch_chat(chat_id)
+    save_queue_sync(chat_id)
+
+def queue_pop(chat_id: int) -> Optional[Dict[str, Any]]:
+    q = radio_queue.get(chat_id) or []
+    if not q:
+        return None
+    entry = q.pop(0)
+    if q:
+        radio_queue[chat_id] = q
+    else:
+        radio_queue.pop(chat_id, None)
+    save_queue_sync(chat_id)
+    return entry
+
+def load_queues_sync():
+    """
+    Restore this shard's queues after a restart. Local entries whose
+    file is gone are dropped; the rest take a store ref again.
+    """
+    if db is None:
+        return
+    try:
+        rows = list(db.queues.find({}, {"_id": 0}))
+    except Exception as e:
+        logging.warning(f"Failed to load queues: {e}")
+        return
+    restored = 0
+    for row in rows:
+        chat_id = row.get("chat_id")
+        if chat_id is None or not owns_chat(chat_id):
+            continue
+        entries = []
+        for entry in row.get("entries") or []:
+            key = entry.get("media_key")
+            if key and not store_for_key(key).acquire(key):
+                continue
+            if entry.get("is_local") and not key and not os.path.isfile(entry.get("stream_url") or ""):
+                continue
+            entries.append(entry)
+        if entries:
+            radio_queue[chat_id] = entries
+            restored += len(entries)
+    logging.info(f"Restored {restored} queued entries")
+
+# ---------- LOCAL HTTP ----------
+class GrowingFile:
+    """
+    A Telegram download in progress that local HTTP readers can tail.
+    """
+
+    def __init__(self, path: str, total: int):
+        self.path = path
+        self.total = total
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self.cond = asyncio.Condition()
+
+    async def notify(self, written: Optional[int] = None):
+        async with self.cond:
+            if written is not None:
+                self.written = written
+            self.cond.notify_all()
+
+    async def wait_for(self, offset: int):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.written > offset or self.done or self.failed)
+
+_progressive: Dict[str, GrowingFile] = {}
+local_http_running = False
+
+def local_media_url(media_key: str) -> str:
+    return f"http://{LOCAL_HTTP_HOST}:{LOCAL_HTTP_PORT}/media/{media_key}"
+
+def _range_start(header: Optional[str]) -> int:
+    m = re.match(r"bytes=(\d+)-", header or "")
+    return int(m.group(1)) if m else 0
+
+async def _serve_media(request: web.Request) -> web.StreamResponse:
+    key = request.match_info["key"]
+    growing = _progressive.get(key)
+    final_path = download_store.path(key)
+    if growing is None:
+        if key in download_store.files and os.path.isfile(final_path):
+            return web.FileResponse(final_path)
+        raise web.HTTPNotFound()
+    start = _range_start(request.headers.get("Range"))
+    if growing.total and start >= growing.total:
+        raise web.HTTPRequestRangeNotSatisfiable()
+    resp = web.StreamResponse(status=206 if start else 200)
+    resp.headers["Accept-Ranges"] = "bytes"
+    if growing.total:
+        resp.content_length = growing.total - start
+        if start:
+            resp.headers["Content-Range"] = f"bytes {start}-{growing.total - 1}/{growing.total}"
+    await resp.prepare(request)
+    try:
+        f = await aiofiles.open(growing.path, mode="rb")
+    except FileNotFoundError:
+        f = await aiofiles.open(final_path, mode="rb")  # finished meanwhile
+    offset = start
+    try:
+        await f.seek(offset)
+        while True:
+            if offset >= growing.written and not growing.done:
+                await growing.wait_for(offset)
+                if growing.failed:
+                    break
+            # the file is preallocated: never read past the contiguous prefix
+            limit = HTTP_CHUNK_SIZE if growing.done else min(HTTP_CHUNK_SIZE, growing.written - offset)
+            chunk = await f.read(limit)
+            if chunk:
+                await resp.write(chunk)
+                offset += len(chunk)
+            elif growing.done:
+                break
+            else:
+                await asyncio.sleep(0.05)
+    except ConnectionResetError:
+        pass
+    finally:
+        await f.close()
+    return resp
+
+class RadioRelay:
+    """
+    Pulls one station once and fans the bytes out to every local listener.
+    Closes the upstream a grace period after the last listener leaves.
+    """
+
+    def __init__(self, key: str, url: str):
+        self.key = key
+        self.url = url
+        self.listeners: set = set()
+        self.burst = bytearray()
+        self.content_type = "application/octet-stream"
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.close_handle: Optional[asyncio.TimerHandle] = None
+        self.bytes_in = 0
+        self.last_data = time.monotonic()
+        self.reconnects = 0
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(maxsize=RADIO_RELAY_QUEUE_CHUNKS)
+        if self.burst:
+            q.put_nowait(bytes(self.burst))
+        self.listeners.add(q)
+        if self.close_handle is not None:
+            self.close_handle.cancel()
+            self.close_handle = None
+        if self.task is None or self.task.done():
+            self.ready.clear()
+            self.task = asyncio.create_task(self._pump())
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self.listeners.discard(q)
+        if not self.listeners and self.close_handle is None:
+            self.close_handle = asyncio.get_running_loop().call_later(RADIO_RELAY_IDLE_GRACE, self.close)
+
+    def close(self):
+        self.close_handle = None
+        if self.listeners:
+            return
+        if self.task is not None:
+            self.task.cancel()
+        _radio_relays.pop(self.key, None)
+        logging.debug(f"radio relay closed: {self.url}")
+
+    def _publish(self, chunk: Optional[bytes]):
+        for q in list(self.listeners):
+            if q.full():
+                try:
+                    q.get_nowait()  # slow listener: drop its oldest chunk
+                except asyncio.QueueEmpty:
+                    pass
+            q.put_nowait(chunk)
+
+    async def _pump(self):
+        """
+        Keep the upstream flowing: a stall (no bytes for RADIO_STALL_SECONDS)
+        or a dropped connection reconnects with exponential backoff while
+        listeners stay connected and simply see a short gap.
+        """
+        failures = 0
+        timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_read=RADIO_STALL_SECONDS)
+        try:
+            while self.listeners:
+                try:
+                    async with get_http_session().get(self.url, ssl=radio_ssl(self.url), timeout=timeout) as resp:
+                        if resp.status != 200:
+                            raise RuntimeError(f"upstream HTTP {resp.status}")
+                        self.content_type = resp.headers.get("Content-Type", self.content_type)
+                        self.ready.set()
+                        async for chunk in resp.content.iter_any():
+                            failures = 0
+                            self.bytes_in += len(chunk)
+                            self.last_data = time.monotonic()
+                            self.burst += chunk
+                            if len(self.burst) > RADIO_RELAY_BURST_BYTES:
+                                del self.burst[:-RADIO_RELAY_BURST_BYTES]
+                            self._publish(chunk)
+                    reason = "upstream ended"
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    reason = str(e) or type(e).__name__
+                failures += 1
+                if failures > RADIO_RECONNECT_MAX or not self.ready.is_set():
+                    logging.warning(f"radio relay giving up on {self.url}: {reason}")
+                    break
+                delay = min(RADIO_BACKOFF_MAX, 2 ** (failures - 1))
+                logging.info(f"radio relay reconnecting to {self.url} in {delay}s ({reason})")
+                await asyncio.sleep(delay)
+                self.reconnects += 1
+        finally:
+            self.ready.set()
+            self.burst.clear()
+            self._publish(None)
+
+_radio_relays: Dict[str, RadioRelay] = {}
+_relay_urls: Dict[str, str] = {}  # relay key -> upstream url
+_relay_used: Dict[str, float] = {}  # relay key -> last handed out or served
+RELAY_URL_TTL = 3600.0
+
+def relay_url(url: str) -> str:
+    """
+    Local relay URL for a live stream, or the URL itself when relaying
+    does not apply (disabled, HLS playlists).
+    """
+    if not (RADIO_RELAY_ENABLED and local_http_running):
+        return url
+    if urlparse(url).path.lower().endswith(".m3u8"):
+        return url
+    key = hashlib.sha1(url.encode("utf-8", "ignore")).hexdigest()[:16]
+    _relay_urls[key] = url
+    _relay_used[key] = time.time()
+    return f"http://{LOCAL_HTTP_HOST}:{LOCAL_HTTP_PORT}/radio/{key}"
+
+async def _serve_radio(request: web.Request) -> web.StreamResponse:
+    key = request.match_info["key"]
+    url = _relay_urls.get(key)
+    if url is None:
+        raise web.HTTPNotFound()
+    _relay_used[key] = time.time()
+    relay = _radio_relays.get(key)
+    if relay is None:
+        relay = _radio_relays[key] = RadioRelay(key, url)
+    q = relay.subscribe()
+    resp = web.StreamResponse()
+    try:
+        await relay.ready.wait()
+        resp.content_type = relay.content_type.split(";")[0].strip() or "application/octet-stream"
+        await resp.prepare(request)
+        while True:
+            chunk = await q.get()
+            if chunk is None:
+                break
+            await resp.write(chunk)
+    except ConnectionResetError:
+        pass
+    finally:
+        relay.unsubscribe(q)
+    return resp
+
+def prune_relay_urls(now: Optional[float] = None) -> int:
+    """
+    Forget relay keys without a running relay that nobody asked for in
+    RELAY_URL_TTL; /rpush accepts any URL, so the map is not bounded otherwise.
+    """
+    now = now or time.time()
+    stale = [k for k in _relay_urls if k not in _radio_relays and now - _relay_used.get(k, 0) > RELAY_URL_TTL]
+    for key in stale:
+        _relay_urls.pop(key, None)
+        _relay_used.pop(key, None)
+    return len(stale)
+
+def build_local_http_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/media/{key}", _serve_media)
+    app.router.add_get("/radio/{key}", _serve_radio)
+    if SHARDED:
+        app.router.add_post("/updates", _serve_updates)
+    return app
+
+async def start_local_http():
+    global local_http_running
+    runner = web.AppRunner(build_local_http_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, LOCAL_HTTP_HOST, LOCAL_HTTP_PORT).start()
+    local_http_running = True
+    logging.info(f"Local media endpoint on {LOCAL_HTTP_HOST}:{LOCAL_HTTP_PORT}")
+
+tg_download_stats = {"count": 0, "bytes": 0, "seconds": 0.0, "last_mbps": 0.0}
+_tg_part_slots = asyncio.Semaphore(TG_DL_PARALLEL_SLOTS)  # part streams across all downloads
+
+async def _stream_tg_parts(message: Message, start: int, count: int, on_part):
+    """
+    Fetch parts [start, start + count) over one stream_media call (one
+    media session), handing each part to on_part(index, data); after a
+    failure it resumes from the first part not yet received.
+    """
+    index, end = start, start + count
+    failures = 0
+    while index < end:
+        try:
+            async with _tg_part_slots:
+                async for chunk in bot.stream_media(message, offset=index, limit=end - index):
+                    await on_part(index, chunk)
+                    index += 1
+                    failures = 0
+            if index < end:
+                raise RuntimeError(f"stream ended early at part {index}")
+        except FloodWait as e:
+            await asyncio.sleep(getattr(e, "value", None) or 1)
+        except Exception:
+            failures += 1
+            if failures >= 3:
+                raise
+            await asyncio.sleep(failures)
+
+async def parallel_tg_download(message: Message, path: str, total: int, on_progress=None) -> int:
+    """
+    Fetch a Telegram file over several concurrent streams, each covering a
+    contiguous run of 1 MiB parts, writing every part at its offset in a
+    preallocated file. on_progress gets the length of the contiguous
+    prefix written so far.
+    """
+    started = time.perf_counter()
+    parts = max(1, (total + TG_CHUNK_SIZE - 1) // TG_CHUNK_SIZE)
+    with open(path, "wb") as f:
+        f.truncate(total)
+    fd = os.open(path, os.O_WRONLY)
+    finished = set()
+    contiguous = 0
+
+    async def on_part(index: int, data: bytes):
+        nonlocal contiguous
+        os.pwrite(fd, data, index * TG_CHUNK_SIZE)
+        finished.add(index)
+        advanced = False
+        while contiguous in finished:
+            finished.discard(contiguous)
+            contiguous += 1
+            advanced = True
+        if advanced and on_progress is not None:
+            await on_progress(min(total, contiguous * TG_CHUNK_SIZE))
+
+    streams = min(TG_DL_CONNECTIONS, TG_DL_PARALLEL_SLOTS, parts)
+    per_stream, extra = divmod(parts, streams)
+    ranges, start = [], 0
+    for i in range(streams):
+        count = per_stream + (1 if i < extra else 0)
+        ranges.append((start, count))
+        start += count
+    workers = [asyncio.create_task(_stream_tg_parts(message, start, count, on_part)) for start, count in ranges]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    finally:
+        os.close(fd)
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    mbps = total / elapsed / (1024 * 1024)
+    tg_download_stats["count"] += 1
+    tg_download_stats["bytes"] += total
+    tg_download_stats["seconds"] += elapsed
+    tg_download_stats["last_mbps"] = mbps
+    logging.info(f"Telegram download: {total} bytes in {elapsed:.2f}s ({mbps:.2f} MiB/s, {parts} parts, {streams} streams)")
+    return total
+
+async def _progressive_download(message: Message, media_key: str, growing: GrowingFile):
+    try:
+        await parallel_tg_download(message, growing.path, growing.total, on_progress=growing.notify)
+        os.replace(growing.path, download_store.path(media_key))
+        growing.done = True
+        download_store.add(media_key, refs=0)
+        logging.debug(f"progressive download finished: {media_key} ({growing.total} bytes)")
+    except Exception as e:
+        logging.warning(f"progressive download failed for {media_key}: {e}")
+        growing.failed = True
+        download_store.discard(media_key)
+        try:
+            os.remove(growing.path)
+        except Exception:
+            pass
+    finally:
+        _progressive.pop(media_key, None)
+        await growing.notify()
+
+def start_progressive_download(message: Message, media_key: str, total: int) -> str:
+    """
+    Reserve the file with one ref and return a local URL that plays as
+    chunks arrive; the finished file lands in the download store.
+    """
+    growing = GrowingFile(download_store.path(media_key) + ".part", total)
+    _progressive[media_key] = growing
+    download_store.reserve(media_key, refs=1)
+    asyncio.create_task(_progressive_download(message, media_key, growing))
+    return local_media_url(media_key)
+
+# ---------- AUDIO CACHE ----------
+track_plays: Dict[str, Dict[str, Any]] = {}  # video_id -> {"plays", "title", "duration", "thumbnail"}
+_transcode_slots = asyncio.Semaphore(AUDIO_CACHE_WORKERS)
+
+def _audio_cache_name(video_id: str) -> str:
+    return f"yt_{_safe_key(video_id)}.ogg"
+
+def get_track_meta(video_id: str) -> Optional[Dict[str, Any]]:
+    meta = track_plays.get(video_id)
+    if meta is None and db is not None:
+        try:
+            row = db.track_stats.find_one({"video_id": video_id})
+            if row:
+                meta = {k: row.get(k) for k in ("plays", "title", "duration", "thumbnail")}
+                meta["plays"] = meta.get("plays") or 0
+                track_plays[video_id] = meta
+        except Exception as e:
+            logging.debug(f"track_stats lookup failed for {video_id}: {e}")
+    return meta
+
+def record_track_play(info: Dict[str, Any]) -> int:
+    video_id = info["video_id"]
+    meta = get_track_meta(video_id) or {"plays": 0}
+    meta["plays"] = meta.get("plays", 0) + 1
+    meta.update(title=info.get("title"), duration=info.get("duration"), thumbnail=info.get("thumbnail"))
+    track_plays[video_id] = meta
+    if db is not None:
+        try:
+            db.track_stats.update_one(
+                {"video_id": video_id},
+                {
+                    "$inc": {"plays": 1},
+                    "$set": {
+                        "title": meta["title"],
+                        "duration": meta["duration"],
+                        "thumbnail": meta["thumbnail"],
+                        "ts": time.time(),
+                    },
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            logging.debug(f"track_stats update failed for {video_id}: {e}")
+    return meta["plays"]
+
+async def _transcode_to_cache(video_id: str, stream_url: str, acodec: Optional[str] = None):
+    name = _audio_cache_name(video_id)
+    part = audio_store.path(name) + ".part"
+    if (acodec or "").startswith("opus"):
+        codec_args = ["-c:a", "copy"]  # already opus: remux only
+    else:
+        codec_args = ["-ac", "2", "-ar", "48000", "-c:a", "libopus", "-b:a", AUDIO_CACHE_BITRATE]
+    async with _transcode_slots:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                "-i", stream_url,
+                "-vn", *codec_args,
+                "-f", "ogg", part,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, err = await proc.communicate()
+            if proc.returncode != 0:
+                raise RuntimeError((err or b"").decode(errors="ignore")[-200:])
+            os.replace(part, audio_store.path(name))
+            audio_store.add(name, refs=0)
+            logging.info(f"Audio cache: stored {video_id} ({audio_store.files.get(name, {}).get('size', 0)} bytes)")
+        except Exception as e:
+            logging.warning(f"Audio cache transcode failed for {video_id}: {e}")
+            try:
+                os.remove(part)
+            except Exception:
+                pass
+
+def cached_track_entry(video_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Entry for a cached track, holding one ref; None if not cached.
+    """
+    if not AUDIO_CACHE_ENABLED or not video_id:
+        return None
+    name = _audio_cache_name(video_id)
+    meta = get_track_meta(video_id)
+    if not meta or not audio_store.acquire(name):
+        return None
+    return {
+        "title": meta.get("title") or "Unknown",
+        "stream_url": audio_store.path(name),
+        "webpage": f"https://www.youtube.com/watch?v={video_id}",
+        "thumbnail": meta.get("thumbnail"),
+        "duration": meta.get("duration"),
+        "is_local": True,
+        "media_key": name,
     }
-    radio_state[chat_id] = state
+
+def note_track_play(info: Dict[str, Any]):
+    """
+    Count a YouTube play and populate the cache in the background once hot.
+    """
+    if not AUDIO_CACHE_ENABLED or not info.get("video_id"):
+        return
+    video_id = info["video_id"]
+    plays = record_track_play(info)
+    if plays >= AUDIO_CACHE_MIN_PLAYS and _audio_cache_name(video_id) not in audio_store.files:
+        asyncio.ensure_future(
+            single_flight(
+                "transcode", video_id, lambda: _transcode_to_cache(video_id, info["stream_url"], info.get("acodec"))
+            )
+        )
+
+# ---------- RADIO SUPERVISOR ----------
+radio_supervisors: Dict[int, asyncio.Task] = {}
+_stream_ended: Dict[int, asyncio.Event] = {}
+radio_reconnects: Dict[int, int] = {}  # chat_id -> reconnects this session
+radio_reconnect_total = {"ok": 0, "failed": 0}
+
+async def on_stream_end(chat_id: int):
+    event = _stream_ended.get(chat_id)
+    if event is not None:
+        event.set()
+
+def register_call_handlers(calls: PyTgCalls):
+    async def _stream_end_handler(_, update):
+        chat_id = getattr(update, "chat_id", None)
+        if chat_id is not None:
+            await on_stream_end(chat_id)
+
+    async def _participant_handler(_, update):
+        chat_id = getattr(update, "chat_id", None)
+        if chat_id is not None and chat_id in radio_state:
+            await refresh_listeners(chat_id)
+
+    if call_filters is not None and hasattr(call_filters, "stream_end"):
+        calls.on_update(call_filters.stream_end())(_stream_end_handler)
+    elif hasattr(calls, "on_stream_end"):
+        calls.on_stream_end()(_stream_end_handler)
+    if call_filters is not None and hasattr(call_filters, "call_participant"):
+        calls.on_update(call_filters.call_participant())(_participant_handler)
+
+async def _replay_live(chat_id: int, url: str):
+    _resolved_streams.pop(url, None)
+    source_url = await resolve_stream_url(url)
+    await assistant_play(chat_id, build_media_stream(chat_id, relay_url(source_url)))
+
+async def radio_supervisor(chat_id: int, url: str):
+    """
+    Live radio has no track_watcher: when PyTgCalls reports the stream
+    ended, replay the same station on the joined call with backoff.
+    Replays and the final leave run on the chat's actor, so they never
+    interleave with /stop, skips or a new /play.
+    """
+    me = asyncio.current_task()
+    event = _stream_ended.setdefault(chat_id, asyncio.Event())
+
+    def _still_ours() -> bool:
+        current = radio_state.get(chat_id)
+        return bool(current) and current.duration is None and current.url == url
+
+    async def _reconnect() -> Optional[str]:
+        if not _still_ours():
+            return None
+        await _replay_live(chat_id, url)
+        return radio_state[chat_id].station
+
+    async def _give_up() -> Optional[PlaybackSession]:
+        if not _still_ours():
+            return None
+        if radio_supervisors.get(chat_id) is me:
+            radio_supervisors.pop(chat_id, None)  # leave_voice_chat must not cancel us
+        state = radio_state.get(chat_id)
+        await leave_voice_chat(chat_id)
+        return state
+
+    try:
+        while True:
+            await event.wait()
+            event.clear()
+            if not _still_ours():
+                return
+            for attempt in range(RADIO_RECONNECT_MAX):
+                await asyncio.sleep(min(RADIO_BACKOFF_MAX, 2 ** attempt))
+                try:
+                    station, _ = await run_in_chat(chat_id, "reconnect", _reconnect)
+                except Exception as e:
+                    logging.debug(f"radio supervisor: reconnect {attempt + 1} failed for {chat_id}: {e}")
+                    continue
+                if station is None:
+                    return
+                radio_reconnects[chat_id] = radio_reconnects.get(chat_id, 0) + 1
+                radio_reconnect_total["ok"] += 1
+                logging.info(f"radio supervisor: {chat_id} reconnected to {station}")
+                event.clear()
+                break
+            else:
+                state, _ = await run_in_chat(chat_id, "stop", _give_up)
+                if state is None:
+                    return
+                radio_reconnect_total["failed"] += 1
+                logging.warning(f"radio supervisor: giving up on {chat_id}")
+                try:
+                    await bot.edit_message_caption(
+                        chat_id=chat_id,
+                        message_id=state.msg_id,
+                        caption=t(chat_id, "STATION_OFFLINE", station=state.station),
+                        reply_markup=None,
+                    )
+                except Exception:
+                    pass
+                return
+    except asyncio.CancelledError:
+        return
+
+def start_radio_supervisor(chat_id: int, url: str):
+    stop_radio_supervisor(chat_id)
+    _stream_ended[chat_id] = asyncio.Event()
+    radio_supervisors[chat_id] = asyncio.create_task(radio_supervisor(chat_id, url))
+
+def stop_radio_supervisor(chat_id: int):
+    task = radio_supervisors.pop(chat_id, None)
+    if task is not None and task is not asyncio.current_task():
+        task.cancel()
+    _stream_ended.pop(chat_id, None)
+    radio_reconnects.pop(chat_id, None)
+
+# ---------- IDLE REAPER ----------
+call_listeners: Dict[int, int] = {}   # chat_id -> participants other than our assistants
+_empty_since: Dict[int, float] = {}
+reaper_stats = {"empty": 0, "paused": 0}
+
+async def refresh_listeners(chat_id: int) -> Optional[int]:
+    """
+    Count the call's participants minus our assistants; None when the
+    PyTgCalls build cannot list them.
+    """
+    calls = bound_assistant(chat_id).calls
+    if not hasattr(calls, "get_participants"):
+        return None
+    try:
+        participants = await calls.get_participants(chat_id)
+    except Exception as e:
+        logging.debug(f"get_participants failed {chat_id}: {e}")
+        return None
+    ours = {slot.id for slot in assistants}
+    count = sum(1 for p in participants if getattr(p, "user_id", None) not in ours)
+    call_listeners[chat_id] = count
+    if count:
+        _empty_since.pop(chat_id, None)
+    else:
+        _empty_since.setdefault(chat_id, time.time())
+    return count
+
+def forget_listeners(chat_id: int):
+    call_listeners.pop(chat_id, None)
+    _empty_since.pop(chat_id, None)
+
+async def _reap(chat_id: int, reason: str, grace: float):
+    msg_id, _ = await run_in_chat(chat_id, "stop", lambda: stop_playback(chat_id))
+    reaper_stats[reason] += 1
+    key = "IDLE_LEFT_EMPTY" if reason == "empty" else "IDLE_LEFT_PAUSED"
+    if msg_id:
+        try:
+            await bot.edit_message_reply_markup(chat_id, msg_id, reply_markup=None)
+        except Exception:
+            pass
+    try:
+        await bot.send_message(chat_id, t(chat_id, key, minutes=max(1, int(grace // 60))))
+    except Exception as e:
+        logging.debug(f"idle notice failed {chat_id}: {e}")
+    log_event_sync("idle_reaped", {"chat_id": chat_id, "reason": reason})
+
+async def idle_reaper_loop():
+    """
+    Participant updates keep call_listeners current; this loop also polls
+    (updates can be missed) and leaves calls that have been empty for
+    IDLE_EMPTY_GRACE or paused for IDLE_PAUSE_GRACE.
+    """
+    while True:
+        await asyncio.sleep(IDLE_REAP_INTERVAL)
+        now = time.time()
+        for chat_id, state in list(radio_state.items()):
+            try:
+                if state.paused and now - (state.ts or now) >= IDLE_PAUSE_GRACE:
+                    await _reap(chat_id, "paused", IDLE_PAUSE_GRACE)
+                    continue
+                await refresh_listeners(chat_id)
+                since = _empty_since.get(chat_id)
+                if since is not None and now - since >= IDLE_EMPTY_GRACE:
+                    await _reap(chat_id, "empty", IDLE_EMPTY_GRACE)
+            except Exception as e:
+                logging.debug(f"idle reaper {chat_id}: {e}")
+        for chat_id in [c for c in call_listeners if c not in radio_state]:
+            forget_listeners(chat_id)
+        evict_inactive_chats(now)
+        prune_relay_urls(now)
+        admit_waiting()
+
+# ---------- SESSION EVICTION ----------
+session_stats = {"evicted": 0}
+
+def touch_chat(chat_id: int):
+    chat_activity[chat_id] = time.time()
+
+def evict_inactive_chats(now: Optional[float] = None) -> int:
+    """
+    Drop per-chat bookkeeping of chats that have had no session for
+    SESSION_IDLE_TTL; their leftover queue entries are released too.
+    """
+    now = now or time.time()
+    evicted = 0
+    for chat_id, last in list(chat_activity.items()):
+        if chat_id in radio_state or chat_id in chat_actors or now - last < SESSION_IDLE_TTL:
+            continue
+        queued = radio_queue.pop(chat_id, None)
+        if queued:
+            for entry in queued:
+                release_entry_media(entry)
+            save_queue_sync(chat_id)
+        for registry in (chat_assistant, radio_reconnects, call_listeners, _empty_since, _stream_ended, _prefetched):
+            registry.pop(chat_id, None)
+        for tasks in (track_watchers, radio_tasks):
+            task = tasks.get(chat_id)
+            if task is not None and task.done():
+                tasks.pop(chat_id, None)
+        radio_paused.discard(chat_id)
+        chat_activity.pop(chat_id, None)
+        evicted += 1
+    mono = time.monotonic()
+    user_buckets.prune(mono)
+    chat_buckets.prune(mono)
+    session_stats["evicted"] += evicted
+    return evicted
+
+def approx_size(obj, _depth: int = 0) -> int:
+    """
+    Rough deep size in bytes: containers and __slots__ records are walked
+    a few levels down, anything else counts as its shallow size.
+    """
+    size = sys.getsizeof(obj)
+    if _depth >= 4:
+        return size
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, _depth + 1) for v in obj)
+    elif hasattr(obj, "__slots__") and not isinstance(obj, asyncio.Future):
+        size += sum(approx_size(getattr(obj, a, None), _depth + 1) for a in obj.__slots__)
+    return size
+
+def memory_report() -> List[Tuple[str, int, int]]:
+    """
+    (name, entries, approx bytes) for each per-chat structure.
+    """
+    structures = (
+        ("sessions", radio_state),
+        ("queues", radio_queue),
+        ("activity", chat_activity),
+        ("watchers", track_watchers),
+        ("timers", radio_tasks),
+        ("actors", chat_actors),
+        ("assistant map", chat_assistant),
+        ("listeners", call_listeners),
+        ("user buckets", user_buckets.buckets),
+        ("chat buckets", chat_buckets.buckets),
+        ("in-flight", _inflight),
+    )
+    return [(name, len(obj), approx_size(obj)) for name, obj in structures]
 
 # ---------- prepare_entry_from_reply ----------
+def _safe_key(value: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_-]", "_", value)
+
+async def _download_tg_media(message: Message, media_key: str, total: int = 0) -> Optional[str]:
+    if total > TG_CHUNK_SIZE:
+        part_path = download_store.path(media_key) + ".part"
+        try:
+            await parallel_tg_download(message, part_path, total)
+            os.replace(part_path, download_store.path(media_key))
+            local_path = download_store.path(media_key)
+        except Exception as e:
+            logging.debug(f"parallel download failed for {media_key}: {e}")
+            try:
+                os.remove(part_path)
+            except Exception:
+                pass
+            return None
+    else:
+        local_path = await bot.download_media(message, file_name=download_store.path(media_key))
+    if not local_path:
+        return None
+    download_store.add(media_key, refs=0, evict=False)
+    return local_path
+
+async def _render_tg_thumb(media, key: str, title: str) -> Optional[str]:
+    tmp_img = os.path.join(THUMB_CACHE_DIR, f"src_{key}.jpg")
+    local = await bot.download_media(media, file_name=tmp_img)
+    if not local:
+        return None
+    try:
+        return await _process_image_and_overlay(local, key, title)
+    finally:
+        try:
+            os.remove(local)
+        except Exception:
+            pass
+
 async def prepare_entry_from_reply(reply_msg: Message) -> Optional[Dict[str, Any]]:
     try:
         media_field = None
@@ -878,9 +3297,27 @@ async def prepare_entry_from_reply(reply_msg: Message) -> Optional[Dict[str, Any
                 ext = ".wav"
             else:
                 ext = ".raw"
-        base_name = f"audio_{int(time.time())}_{random.randint(1000,9999)}"
-        download_path = os.path.join(DOWNLOADS_DIR, base_name + ext)
-        local_path = await bot.download_media(reply_msg, file_name=download_path)
+        unique_id = getattr(media_field, "file_unique_id", None)
+        if unique_id:
+            base_name = f"tg_{_safe_key(unique_id)}"
+        else:
+            base_name = f"audio_{int(time.time())}_{random.randint(1000,9999)}"
+        media_key = base_name + ext
+        file_size = getattr(media_field, "file_size", None) or 0
+        if media_key in _progressive and download_store.acquire(media_key):
+            local_path = local_media_url(media_key)
+        elif download_store.acquire(media_key):
+            local_path = download_store.path(media_key)
+        elif local_http_running and unique_id and file_size >= PROGRESSIVE_MIN_BYTES:
+            local_path = start_progressive_download(reply_msg, media_key, file_size)
+        else:
+            # not cached yet: one transfer per file, concurrent requests share it
+            local_path = await single_flight(
+                "tg_download", media_key, lambda: _download_tg_media(reply_msg, media_key, file_size)
+            )
+            if not local_path or not download_store.acquire(media_key):
+                return None
+            download_store.evict()
         title = (
             getattr(media_field, "title", None)
             or getattr(media_field, "file_name", None)
@@ -889,59 +3326,324 @@ async def prepare_entry_from_reply(reply_msg: Message) -> Optional[Dict[str, Any
         )
         duration = getattr(media_field, "duration", None) or None
         thumb_path = None
-        if reply_msg.photo:
-            tmp_img = os.path.join(THUMB_CACHE_DIR, f"photo_{base_name}.jpg")
-            thumb_path_local = await bot.download_media(reply_msg.photo, file_name=tmp_img)
-            thumb_path = await _process_image_and_overlay(thumb_path_local, base_name, title)
+        thumb_media = reply_msg.photo or getattr(media_field, "thumb", None)
+        if thumb_media and shed_level < 2:
+            thumb_id = getattr(thumb_media, "file_unique_id", None)
+            thumb_key = f"tg_{_safe_key(thumb_id)}" if thumb_id else base_name
+            try:
+                thumb_path = await single_flight(
+                    "render", thumb_key, lambda: _render_tg_thumb(thumb_media, thumb_key, title)
+                )
+            except Exception:
+                thumb_path = None
+        entry = {
+            "title": title,
+            "stream_url": local_path,
+            "webpage": None,
+            "thumbnail": thumb_path,
+            "duration": duration,
+            "is_local": True,
+            "media_key": media_key,
+        }
+        return entry
+    except Exception as e:
+        logging.debug(f"prepare_entry_from_reply failed: {e}")
+        return None
+
+# ---------- CHAT ACTORS ----------
+ACTOR_COALESCE_WINDOW = 2.0  # an advance that started this recently absorbs new ones
+COALESCING_KINDS = ("advance",)
+
+class ChatActor:
+    """
+    Serial mailbox for one chat's playback commands. Commands run one at
+    a time in arrival order; an "advance" (skip or auto-advance) that is
+    waiting, or started a moment ago, absorbs new ones so repeated skip
+    presses move one track.
+    """
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.mailbox: List[Tuple[str, Any, asyncio.Future]] = []
+        self.running: Optional[Tuple[str, float, asyncio.Future]] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def submit(self, kind: str, fn) -> Tuple[asyncio.Future, bool]:
+        stats = coalesce_stats.setdefault(f"chat {kind}", {"calls": 0, "coalesced": 0})
+        stats["calls"] += 1
+        if kind in COALESCING_KINDS:
+            if (
+                self.running
+                and self.running[0] == kind
+                and time.monotonic() - self.running[1] < ACTOR_COALESCE_WINDOW
+            ):
+                stats["coalesced"] += 1
+                return self.running[2], True
+            for pending_kind, _, fut in self.mailbox:
+                if pending_kind == kind:
+                    stats["coalesced"] += 1
+                    return fut, True
+        fut = asyncio.get_event_loop().create_future()
+        self.mailbox.append((kind, fn, fut))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return fut, False
+
+    async def _run(self):
+        try:
+            while self.mailbox:
+                kind, fn, fut = self.mailbox.pop(0)
+                self.running = (kind, time.monotonic(), fut)
+                try:
+                    result = await fn()
+                    if not fut.done():
+                        fut.set_result(result)
+                except Exception as e:
+                    logging.debug(f"chat actor {self.chat_id} {kind} failed: {e}")
+                    if not fut.done():
+                        fut.set_exception(e)
+                finally:
+                    self.running = None
+        finally:
+            if not self.mailbox and chat_actors.get(self.chat_id) is self:
+                chat_actors.pop(self.chat_id, None)
+
+chat_actors: Dict[int, ChatActor] = {}
+
+async def run_in_chat(chat_id: int, kind: str, fn) -> Tuple[Any, bool]:
+    """
+    Run fn() on the chat's actor; returns (result, coalesced). A caller
+    that is cancelled does not cancel the command for the others.
+    """
+    actor = chat_actors.get(chat_id)
+    if actor is None:
+        actor = chat_actors[chat_id] = ChatActor(chat_id)
+    fut, coalesced = actor.submit(kind, fn)
+    return await asyncio.shield(fut), coalesced
+
+async def advance_playback(
+    chat_id: int, expect_msg_id: Optional[int] = None, switch_t0: Optional[float] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Switch the joined call to the next playable queued entry, skipping
+    ones that fail; leave only when nothing is left. With expect_msg_id
+    (auto-advance) nothing happens if another track started meanwhile.
+    Returns ("played" | "failed" | "stopped" | "stale", entry).
+    """
+    if expect_msg_id is not None:
+        state = radio_state.get(chat_id)
+        if not state or state.msg_id != expect_msg_id:
+            return "stale", None
+    switch_t0 = switch_t0 or time.monotonic()
+    failed = None
+    while True:
+        next_entry = queue_pop(chat_id)
+        if not next_entry:
+            await leave_voice_chat(chat_id, cancel_watchers=expect_msg_id is None)
+            return ("failed", failed) if failed else ("stopped", None)
+        if await play_entry(chat_id, next_entry, switch_t0=switch_t0, keep_call=True):
+            return "played", next_entry
+        failed = next_entry
+
+async def pause_playback(chat_id: int) -> bool:
+    state = radio_state.get(chat_id)
+    if not state:
+        return False
+    await _safe_call_py_method("pause_stream", chat_id)
+    await _safe_call_py_method("pause", chat_id)
+    start_time = state.start_time or time.time()
+    elapsed = time.time() - start_time if start_time else state.elapsed
+    radio_paused.add(chat_id)
+    store_play_state(
+        chat_id,
+        state.station,
+        state.url,
+        state.msg_id,
+        None,
+        elapsed=elapsed,
+        paused=True,
+        duration=state.duration,
+        media_key=state.media_key,
+    )
+    return True
+
+async def resume_playback(chat_id: int) -> bool:
+    state = radio_state.get(chat_id)
+    if not state:
+        return False
+    await _safe_call_py_method("resume_stream", chat_id)
+    await _safe_call_py_method("resume", chat_id)
+    elapsed = state.elapsed or 0.0
+    start_time = time.time() - elapsed
+    radio_paused.discard(chat_id)
+    duration = state.duration  # None => radio (no timer)
+    store_play_state(
+        chat_id,
+        state.station,
+        state.url,
+        state.msg_id,
+        start_time,
+        elapsed=0.0,
+        paused=False,
+        duration=duration,
+        media_key=state.media_key,
+    )
+    if duration is not None:
+        if chat_id in radio_tasks:
             try:
-                os.remove(thumb_path_local)
+                radio_tasks[chat_id].cancel()
             except Exception:
                 pass
-        else:
-            thumb_attr = getattr(media_field, "thumb", None)
-            if thumb_attr:
-                tmp_img = os.path.join(THUMB_CACHE_DIR, f"thumb_{base_name}.jpg")
-                try:
-                    thumb_local = await bot.download_media(thumb_attr, file_name=tmp_img)
-                    thumb_path = await _process_image_and_overlay(thumb_local, base_name, title)
-                    try:
-                        os.remove(thumb_local)
-                    except Exception:
-                        pass
-                except Exception:
-                    thumb_path = None
-        entry = {
-            "title": title,
-            "stream_url": local_path,
-            "webpage": None,
-            "thumbnail": thumb_path,
-            "duration": duration,
-            "is_local": True,
-        }
-        return entry
+            radio_tasks.pop(chat_id, None)
+        radio_tasks[chat_id] = asyncio.create_task(
+            update_radio_timer(chat_id, state.msg_id, state.station, start_time, duration)
+        )
+    return True
+
+async def stop_playback(chat_id: int) -> Optional[int]:
+    """
+    Leave the call; returns the now-playing message id, if any.
+    """
+    state = radio_state.get(chat_id)
+    msg_id = state.msg_id if state else None
+    await leave_voice_chat(chat_id)
+    return msg_id
+
+# ---------- GAPLESS ----------
+_prefetched: Dict[int, Tuple[str, str]] = {}  # chat_id -> (entry's prefetch_id, prepared source)
+switch_stats = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0, "under_1s": 0}
+
+def note_switch(t0: float):
+    ms = (time.monotonic() - t0) * 1000
+    switch_stats["count"] += 1
+    switch_stats["total_ms"] += ms
+    switch_stats["last_ms"] = ms
+    switch_stats["max_ms"] = max(switch_stats["max_ms"], ms)
+    if ms < 1000:
+        switch_stats["under_1s"] += 1
+
+async def prepare_stream_source(chat_id: int, entry: Dict[str, Any]) -> str:
+    """
+    What play() should open for the entry: radio resolved and relayed,
+    YouTube URLs re-resolved when close to expiring.
+    """
+    source = entry["stream_url"]
+    if entry.get("is_radio"):
+        return relay_url(await resolve_stream_url(source))
+    resolved_at = entry.get("resolved_at")
+    if resolved_at and time.time() - resolved_at > YT_URL_MAX_AGE and entry.get("webpage"):
+        info = await resolve_track(entry["webpage"], quality_abr(chat_id))
+        if info and info.get("stream_url"):
+            entry["stream_url"] = source = info["stream_url"]
+            entry["resolved_at"] = time.time()
+    return source
+
+def _warm_source(source: str):
+    """
+    Start buffering: a relayed station starts filling its burst buffer
+    (the relay outlives this for RADIO_RELAY_IDLE_GRACE), a local file is
+    read ahead into the page cache.
+    """
+    prefix = f"http://{LOCAL_HTTP_HOST}:{LOCAL_HTTP_PORT}/radio/"
+    if source.startswith(prefix):
+        key = source[len(prefix):]
+        url = _relay_urls.get(key)
+        if url:
+            relay = _radio_relays.get(key)
+            if relay is None:
+                relay = _radio_relays[key] = RadioRelay(key, url)
+            relay.unsubscribe(relay.subscribe())
+    elif os.path.isfile(source):
+        try:
+            fd = os.open(source, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except (OSError, AttributeError):
+            pass
+
+async def prefetch_next(chat_id: int):
+    """
+    Prepare the head of the queue while the current track is still
+    playing, so the switch is only the play() call.
+    """
+    q = radio_queue.get(chat_id) or []
+    if not q:
+        return
+    entry = q[0]
+    try:
+        source = await prepare_stream_source(chat_id, entry)
+        _warm_source(source)
+        token = entry.setdefault("prefetch_id", os.urandom(8).hex())
+        _prefetched[chat_id] = (token, source)
+        thumb = entry.get("thumbnail")
+        if shed_level < 2 and not (isinstance(thumb, str) and os.path.isfile(thumb)):
+            rendered = await get_thumb_from_url_or_webpage(
+                thumb if isinstance(thumb, str) and thumb.startswith("http") else None,
+                entry.get("webpage"),
+                entry.get("title") or "Unknown",
+            )
+            if rendered:
+                entry["thumbnail"] = rendered
     except Exception as e:
-        logging.debug(f"prepare_entry_from_reply failed: {e}")
-        return None
+        logging.debug(f"prefetch for {chat_id} failed: {e}")
+
+# ---------- track_watcher ----------
+async def wait_track_end(chat_id: int, duration: int, msg_id: int) -> Optional[float]:
+    """
+    Until the stream-end update (or the expected end plus TRACK_END_SLACK
+    if it never comes), prefetching the next entry shortly before. Paused
+    time does not count. Returns the monotonic end time, None when
+    another track took over.
+    """
+    event = _stream_ended[chat_id] = asyncio.Event()
+    prefetched = False
+    while True:
+        state = radio_state.get(chat_id)
+        if not state or state.msg_id != msg_id:
+            return None
+        elapsed = state.elapsed if state.paused else time.time() - (state.start_time or time.time())
+        remaining = duration - elapsed
+        if not state.paused:
+            if not prefetched and remaining <= PREFETCH_AHEAD:
+                prefetched = True
+                asyncio.ensure_future(prefetch_next(chat_id))
+            if remaining <= -TRACK_END_SLACK:
+                return time.monotonic()
+        if state.paused:
+            timeout = 5.0
+        elif not prefetched:
+            timeout = max(0.2, remaining - PREFETCH_AHEAD)
+        else:
+            timeout = max(0.2, remaining + TRACK_END_SLACK)
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(timeout, 30.0))
+        except asyncio.TimeoutError:
+            continue
+        if not state.paused and time.time() - (state.start_time or 0) < min(3, duration / 2):
+            event.clear()  # late end update for the stream we just replaced
+            continue
+        return time.monotonic()
 
 # ---------- track_watcher ----------
 async def track_watcher(chat_id: int, duration: int, msg_id: int):
     """
-    Wait track length; if queue empty -> auto stop & leave VC.
+    Wait for the track to end; if queue empty -> auto stop & leave VC.
     """
     try:
-        await asyncio.sleep(max(1, duration) + 2)
-        q = radio_queue.get(chat_id, [])
-        if q:
-            next_entry = q.pop(0)
-            radio_queue[chat_id] = q
-            await play_entry(chat_id, next_entry)
+        ended = await wait_track_end(chat_id, max(1, duration), msg_id)
+        if ended is None:
+            return
+        if track_watchers.get(chat_id) is asyncio.current_task():
+            track_watchers.pop(chat_id, None)  # the next play_entry must not cancel us
+        (outcome, next_entry), _ = await run_in_chat(
+            chat_id, "advance", lambda: advance_playback(chat_id, expect_msg_id=msg_id, switch_t0=ended)
+        )
+        if outcome in ("played", "failed"):
             log_event_sync("music_auto_skipped", {"chat_id": chat_id, "title": next_entry.get("title")})
-        else:
+        elif outcome == "stopped":
             # queue  -> assistant leave + caption stop + buttons remove
-            try:
-                await leave_voice_chat(chat_id, cancel_watchers=False)
-            except Exception:
-                pass
             try:
                 await bot.edit_message_caption(
                     chat_id=chat_id,
@@ -958,18 +3660,38 @@ async def track_watcher(chat_id: int, duration: int, msg_id: int):
         logging.debug(f"track_watcher error {chat_id}: {e}")
 
 # ---------- play_entry ----------
-async def play_entry(chat_id: int, entry: dict, reply_message: Optional[Message] = None):
+async def play_entry(
+    chat_id: int,
+    entry: dict,
+    reply_message: Optional[Message] = None,
+    switch_t0: Optional[float] = None,
+    keep_call: bool = False,
+):
+    """
+    Play entry on the chat's call (switching the stream in place when
+    already joined). keep_call: on failure stay in the call so the caller
+    can try the next entry.
+    """
+    entry_owned = True  # entry's media ref not yet handed to radio_state
     try:
+        prefetched = _prefetched.pop(chat_id, None)
+        if prefetched and prefetched[0] == entry.get("prefetch_id"):
+            stream_source = prefetched[1]
+        else:
+            stream_source = await prepare_stream_source(chat_id, entry)
+        await assistant_play(chat_id, build_media_stream(chat_id, stream_source))
+        if switch_t0 is not None:
+            note_switch(switch_t0)
         if chat_id in radio_tasks:
             radio_tasks[chat_id].cancel()
             radio_tasks.pop(chat_id, None)
-        stream_source = entry["stream_url"]
-        await _safe_call_py_method("play", chat_id, MediaStream(stream_source))
         thumb_path = None
         thumb_val = entry.get("thumbnail")
         title = entry.get("title") or "Unknown"
         if thumb_val and isinstance(thumb_val, str) and os.path.isfile(thumb_val):
             thumb_path = thumb_val
+        elif shed_level >= 2:
+            thumb_path = None  # shedding: default artwork, no download/render
         else:
             if thumb_val and isinstance(thumb_val, str) and thumb_val.startswith("http"):
                 thumb_path = await get_thumb_from_url_or_webpage(thumb_val, entry.get("webpage"), title)
@@ -1007,6 +3729,8 @@ async def play_entry(chat_id: int, entry: dict, reply_message: Optional[Message]
         if not duration or duration <= 0:
             duration = DEFAULT_FALLBACK_DURATION
         start_time = time.time()
+        release_state_media(chat_id)
+        stop_radio_supervisor(chat_id)
         store_play_state(
             chat_id,
             title,
@@ -1016,7 +3740,9 @@ async def play_entry(chat_id: int, entry: dict, reply_message: Optional[Message]
             elapsed=0.0,
             paused=False,
             duration=duration,
+            media_key=entry.get("media_key"),
         )
+        entry_owned = False
         radio_paused.discard(chat_id)
         radio_tasks[chat_id] = asyncio.create_task(
             update_radio_timer(chat_id, msg.id, title, start_time, duration)
@@ -1031,6 +3757,10 @@ async def play_entry(chat_id: int, entry: dict, reply_message: Optional[Message]
         return True
     except Exception:
         logging.error("Play entry failed", exc_info=True)
+        if entry_owned:
+            release_entry_media(entry)
+        if keep_call and chat_id in radio_state:
+            return False
         try:
             await leave_voice_chat(chat_id)
         except Exception:
@@ -1044,35 +3774,11 @@ async def cmd_play(_, message: Message):
     user = message.from_user
     if is_group_blocked_sync(chat_id):
         return await message.reply_text(t(chat_id, "GROUP_BLOCKED"))
-    try:
-        assistant_user = await assistant.get_me()
-        assistant_id = assistant_user.id
-    except Exception:
-        assistant_id = None
-    assistant_present = False
-    if assistant_id:
-        try:
-            await assistant.get_chat_member(chat_id, assistant_id)
-            assistant_present = True
-        except RPCError:
-            assistant_present = False
-    if not assistant_present:
-        try:
-            invite = await bot.create_chat_invite_link(chat_id, member_limit=1, name="DLK BOT assistant")
-            invite_link = invite.invite_link
-            try:
-                await assistant.join_chat(invite_link)
-                assistant_present = True
-                try:
-                    await bot.send_message(chat_id, t(chat_id, "ASSISTANT_JOIN_INFO"), disable_web_page_preview=True)
-                except Exception:
-                    pass
-            except Exception:
-                kb = InlineKeyboardMarkup([[InlineKeyboardButton("📋 Invite Link", url=invite_link)]])
-                await message.reply_text(t(chat_id, "ASSISTANT_INVITE_TEXT"), reply_markup=kb)
-                return
-        except Exception:
-            return await message.reply_text(t(chat_id, "ASSISTANT_NOT_IN_GROUP"))
+    rejected = admit_request(chat_id, user.id if user else None)
+    if rejected:
+        return await message.reply_text(rejected)
+    if await ensure_assistant(chat_id, message) is None:
+        return
     entry = None
     info_msg = None
     if message.reply_to_message:
@@ -1088,66 +3794,95 @@ async def cmd_play(_, message: Message):
         if not query:
             return await message.reply_text(t(chat_id, "PLAY_USAGE"))
         info_msg = await message.reply_text(t(chat_id, "SEARCHING_STREAM"))
-        info = extract_audio_url(query)
-        if info is None or not info.get("stream_url"):
-            await info_msg.edit_text(t(chat_id, "YTDLP_FAIL"))
-            return
-        entry = {
-            "title": info.get("title"),
-            "stream_url": info.get("stream_url"),
-            "webpage": info.get("webpage_url"),
-            "thumbnail": info.get("thumbnail"),
-            "duration": info.get("duration"),
-            "is_local": False,
-        }
-    if chat_id not in radio_queue:
-        radio_queue[chat_id] = []
-    current_state = radio_state.get(chat_id)
-    if current_state and not current_state.get("paused"):
-        radio_queue[chat_id].append(entry)
-        try:
-            if info_msg:
-                await info_msg.edit_text(t(chat_id, "ADDED_QUEUE", title=entry["title"]))
-        except Exception:
-            pass
-        log_event_sync("music_queued", {"chat_id": chat_id, "title": entry["title"], "by": user.id})
-        return
-    ok = await play_entry(chat_id, entry, reply_message=message)
-    if ok:
-        try:
-            if info_msg:
-                await info_msg.edit_text(t(chat_id, "NOW_PLAYING", title=entry["title"]))
-        except Exception:
-            pass
-    else:
+        video_id = get_youtube_id(query) if looks_like_url(query) else None
+        entry = cached_track_entry(video_id)
+        if entry:
+            note_track_play({"video_id": video_id, **{k: entry[k] for k in ("title", "duration", "thumbnail")}})
+        else:
+            try:
+                info = await resolve_track(query, quality_abr(chat_id))
+            except ResolverBusy:
+                await info_msg.edit_text(t(chat_id, "BOT_BUSY", seconds=30))
+                return
+            if info is None or not info.get("stream_url"):
+                await info_msg.edit_text(t(chat_id, "YTDLP_FAIL"))
+                return
+            note_track_play(info)
+            entry = cached_track_entry(info.get("video_id")) or {
+                "title": info.get("title"),
+                "stream_url": info.get("stream_url"),
+                "webpage": info.get("webpage_url"),
+                "thumbnail": info.get("thumbnail"),
+                "duration": info.get("duration"),
+                "is_local": False,
+                "resolved_at": time.time(),
+            }
+
+    async def _play_or_queue():
+        current_state = radio_state.get(chat_id)
+        if current_state and not current_state.paused:
+            if len(radio_queue.get(chat_id) or []) >= QUEUE_MAX_PER_CHAT:
+                release_entry_media(entry)
+                return "full"
+            queue_push(chat_id, entry)
+            return "queued"
+        return "played" if await play_entry(chat_id, entry, reply_message=message) else "failed"
+
+    async def _notify(text: str):
         try:
             if info_msg:
-                await info_msg.edit_text(t(chat_id, "FAILED_PLAY_REQUEST"))
+                await info_msg.edit_text(text)
+            else:
+                await message.reply_text(text)
         except Exception:
             pass
 
+    async def _start():
+        outcome, _ = await run_in_chat(chat_id, "play", _play_or_queue)
+        if outcome == "full":
+            try:
+                if info_msg:
+                    await info_msg.edit_text(t(chat_id, "QUEUE_FULL", limit=QUEUE_MAX_PER_CHAT))
+            except Exception:
+                pass
+            return
+        if outcome == "queued":
+            try:
+                if info_msg:
+                    await info_msg.edit_text(t(chat_id, "ADDED_QUEUE", title=entry["title"]))
+            except Exception:
+                pass
+            log_event_sync("music_queued", {"chat_id": chat_id, "title": entry["title"], "by": user.id})
+            return
+        if outcome == "played":
+            try:
+                if info_msg:
+                    await info_msg.edit_text(t(chat_id, "NOW_PLAYING", title=entry["title"]))
+            except Exception:
+                pass
+        else:
+            try:
+                if info_msg:
+                    await info_msg.edit_text(t(chat_id, "FAILED_PLAY_REQUEST"))
+            except Exception:
+                pass
+
+    await run_when_call_free(chat_id, _notify, _start, on_give_up=lambda: release_entry_media(entry))
+
 # ---------- /skip /queue /stop ----------
 @bot.on_message(filters.group & filters.command(["skip", "s"]))
 async def cmd_skip(_, message: Message):
     chat_id = message.chat.id
     if not await dlk_privilege_validator(message):
         return await message.reply_text(t(chat_id, "ONLY_ADMINS_SKIP"))
-    q = radio_queue.get(chat_id, [])
-    if not q:
-        await leave_voice_chat(chat_id)
+    (outcome, next_entry), coalesced = await run_in_chat(chat_id, "advance", lambda: advance_playback(chat_id))
+    if coalesced or outcome == "stale":
+        return
+    if outcome == "stopped":
         await message.reply_text(t(chat_id, "SKIPPED_NO_QUEUE"))
         log_event_sync("music_skipped_stop", {"chat_id": chat_id, "by": message.from_user.id})
         return
-    next_entry = q.pop(0)
-    radio_queue[chat_id] = q
-    if chat_id in track_watchers:
-        try:
-            track_watchers[chat_id].cancel()
-        except Exception:
-            pass
-        track_watchers.pop(chat_id, None)
-    ok = await play_entry(chat_id, next_entry)
-    if ok:
+    if outcome == "played":
         await message.reply_text(t(chat_id, "NOW_PLAYING_QUEUE", title=next_entry["title"]))
         log_event_sync("music_skipped", {"chat_id": chat_id, "title": next_entry["title"], "by": message.from_user.id})
     else:
@@ -1171,10 +3906,7 @@ async def general_stop_handler(_, message: Message):
         return await message.reply_text(t(chat_id, "ONLY_ADMINS_STOP"))
 
     # state  - leave_voice_chat()  clear 
-    state = radio_state.get(chat_id)
-    msg_id = state.get("msg_id") if state else None
-
-    await leave_voice_chat(chat_id)
+    msg_id, _ = await run_in_chat(chat_id, "stop", lambda: stop_playback(chat_id))
 
     if msg_id:
         try:
@@ -1196,6 +3928,15 @@ async def cmd_radio_menu(_, message: Message):
     chat_id = message.chat.id
     if is_group_blocked_sync(chat_id):
         return await message.reply_text(t(chat_id, "GROUP_BLOCKED"))
+    if len(message.command) > 1:
+        query = message.text.split(None, 1)[1].strip()
+        names = station_catalog.search(query)
+        if not names:
+            return await message.reply_text(t(chat_id, "NO_STATION_MATCH", query=query))
+        return await message.reply_text(
+            t(chat_id, "STATION_SEARCH_RESULTS", query=query),
+            reply_markup=station_catalog.keyboard(names),
+        )
     kb = radio_buttons(0)
     await message.reply_text("📻 Radio Stations - choose one:", reply_markup=kb)
 
@@ -1205,7 +3946,7 @@ async def cmd_rend(_, message: Message):
     if not await dlk_privilege_validator(message):
         return await message.reply_text(t(chat_id, "ONLY_ADMINS_RADIO_END"))
     try:
-        await leave_voice_chat(chat_id)
+        await run_in_chat(chat_id, "stop", lambda: stop_playback(chat_id))
         await message.reply_text(t(chat_id, "RADIO_ENDED"))
         log_event_sync("radio_rend", {"chat_id": chat_id, "by": message.from_user.id})
     except Exception as e:
@@ -1217,22 +3958,14 @@ async def cmd_rskip(_, message: Message):
     chat_id = message.chat.id
     if not await dlk_privilege_validator(message):
         return await message.reply_text(t(chat_id, "ONLY_ADMINS_RADIO_SKIP"))
-    q = radio_queue.get(chat_id, [])
-    if not q:
-        await leave_voice_chat(chat_id)
+    (outcome, next_entry), coalesced = await run_in_chat(chat_id, "advance", lambda: advance_playback(chat_id))
+    if coalesced or outcome == "stale":
+        return
+    if outcome == "stopped":
         await message.reply_text(t(chat_id, "SKIPPED_NO_QUEUE_RADIO"))
         log_event_sync("radio_rskip_stop", {"chat_id": chat_id, "by": message.from_user.id})
         return
-    next_entry = q.pop(0)
-    radio_queue[chat_id] = q
-    if chat_id in track_watchers:
-        try:
-            track_watchers[chat_id].cancel()
-        except Exception:
-            pass
-        track_watchers.pop(chat_id, None)
-    ok = await play_entry(chat_id, next_entry)
-    if ok:
+    if outcome == "played":
         await message.reply_text(t(chat_id, "NOW_PLAYING_QUEUE", title=next_entry["title"]))
         log_event_sync("radio_rskip", {"chat_id": chat_id, "title": next_entry["title"], "by": message.from_user.id})
     else:
@@ -1253,20 +3986,32 @@ async def cmd_rpush(_, message: Message):
     station_name = args
     stream_url = None
     title = station_name
-    if station_name in RADIO_STATION:
-        stream_url = RADIO_STATION[station_name]
-        title = station_name
-    elif looks_like_url(station_name):
+    if looks_like_url(station_name):
         stream_url = station_name
         title = station_name.split("/")[-1] or station_name
     else:
-        for k in RADIO_STATION.keys():
-            if k.lower() == station_name.lower():
-                stream_url = RADIO_STATION[k]
-                title = k
-                break
+        # only an exact name or alias queues; prefix/fuzzy hits are suggestions
+        exact = station_catalog.lookup(station_name)
+        if exact:
+            title = exact
+            stream_url = station_catalog.urls[title]
+        else:
+            found = station_catalog.search(station_name, limit=5)
+            if found:
+                return await message.reply_text(
+                    t(chat_id, "STATION_DID_YOU_MEAN", query=station_name, names=", ".join(found), first=found[0])
+                )
     if not stream_url:
         return await message.reply_text("Could not find station or invalid URL. Provide a valid station name or URL.")
+    rejected = admit_request(chat_id, message.from_user.id if message.from_user else None)
+    if rejected:
+        return await message.reply_text(rejected)
+    if not await station_available(title, stream_url):
+        return await message.reply_text(t(chat_id, "STATION_OFFLINE", station=title))
+    try:
+        await resolve_stream_url(stream_url)
+    except StreamResolveError as e:
+        return await message.reply_text(t(chat_id, "STREAM_BROKEN", error=str(e)))
     entry = {
         "title": title,
         "stream_url": stream_url,
@@ -1274,10 +4019,9 @@ async def cmd_rpush(_, message: Message):
         "thumbnail": None,
         "duration": None,
         "is_local": False,
+        "is_radio": True,
     }
-    if chat_id not in radio_queue:
-        radio_queue[chat_id] = []
-    radio_queue[chat_id].append(entry)
+    queue_push(chat_id, entry)
     await message.reply_text(t(chat_id, "ADDED_RADIO_QUEUE", title=title))
     log_event_sync("radio_rpush", {"chat_id": chat_id, "title": title, "by": message.from_user.id})
 
@@ -1290,37 +4034,11 @@ async def cmd_rresume(_, message: Message):
     if not state:
         return await message.reply_text(t(chat_id, "NOTHING_TO_RESUME"))
     try:
-        await _safe_call_py_method("resume_stream", chat_id)
-        await _safe_call_py_method("resume", chat_id)
-        elapsed = state.get("elapsed", 0.0) or 0.0
-        start_time = time.time() - elapsed
-        state["paused"] = False
-        state["elapsed"] = 0.0
-        state["start_time"] = start_time
-        radio_paused.discard(chat_id)
-        duration = state.get("duration")  # None => radio
-        store_play_state(
-            chat_id,
-            state.get("station"),
-            state.get("url"),
-            state.get("msg_id"),
-            start_time,
-            elapsed=0.0,
-            paused=False,
-            duration=duration,
-        )
-        if duration is not None:
-            if chat_id in radio_tasks:
-                try:
-                    radio_tasks[chat_id].cancel()
-                except Exception:
-                    pass
-                radio_tasks.pop(chat_id, None)
-            radio_tasks[chat_id] = asyncio.create_task(
-                update_radio_timer(chat_id, state.get("msg_id"), state.get("station"), start_time, duration)
-            )
+        resumed, _ = await run_in_chat(chat_id, "resume", lambda: resume_playback(chat_id))
+        if not resumed:
+            return await message.reply_text(t(chat_id, "NOTHING_TO_RESUME"))
         try:
-            await bot.edit_message_reply_markup(chat_id, state.get("msg_id"), reply_markup=player_controls_markup(chat_id))
+            await bot.edit_message_reply_markup(chat_id, state.msg_id, reply_markup=player_controls_markup(chat_id))
         except Exception:
             pass
         await message.reply_text(t(chat_id, "RADIO_RESUMED"))
@@ -1378,15 +4096,115 @@ async def owner_panel(_, message: Message):
         logging.warning(f"Failed to fetch blocked list: {e}")
         await message.reply_text(t(chat_id, "FAILED_FETCH_BLOCKS"))
 
+@bot.on_message(filters.private & filters.command(["stats"]))
+async def owner_stats(_, message: Message):
+    chat_id = message.chat.id
+    if not message.from_user or message.from_user.id != OWNER_ID:
+        return await message.reply_text(t(chat_id, "ONLY_OWNER_PANEL"))
+    cpu_pct = sample_cpu_percent()
+    count = render_stats["count"]
+    lines = [
+        "📊 DLK BOT stats",
+        f"Uptime: {int(time.time() - bot_start_time)}s",
+        f"Shard: {SHARD_ID}/{SHARD_COUNT}" if SHARDED else "Shard: single process",
+        f"Active sessions: {len(radio_state)}",
+        f"CPU since last /stats: {cpu_pct:.1f}% ({cpu_pct / max(1, len(radio_state)):.1f}% per stream)",
+        f"Thumbnails rendered: {count}",
+    ]
+    if count:
+        lines.append(
+            f"Render avg: {render_stats['total_ms'] / count:.1f} ms, last: {render_stats['last_ms']:.1f} ms"
+        )
+        lines.append(
+            f"Output avg: {render_stats['total_bytes'] // count} bytes, last: {render_stats['last_bytes']} bytes"
+        )
+        lines.append(f"Peak decode: ~{render_stats['peak_decode_bytes'] // 1024} KiB")
+    lines.append(
+        f"Downloads: {len(download_store.files)} files, "
+        f"{download_store.total_bytes() // (1024 * 1024)}/{DOWNLOADS_QUOTA_MB} MB"
+    )
+    if AUDIO_CACHE_ENABLED:
+        lines.append(
+            f"Audio cache: {len(audio_store.files)} tracks, "
+            f"{audio_store.total_bytes() // (1024 * 1024)}/{AUDIO_CACHE_QUOTA_MB} MB"
+        )
+    if station_health:
+        up = stations_by_latency()
+        lines.append(f"Stations up: {len(up)}/{len(station_health)}; fastest: {', '.join(up[:3]) or 'n/a'}")
+        down = [n for n in station_health if station_is_dead(n)]
+        if down:
+            lines.append(f"Stations down: {', '.join(sorted(down))}")
+    if _radio_relays:
+        listeners = sum(len(r.listeners) for r in _radio_relays.values())
+        relayed = sum(r.bytes_in for r in _radio_relays.values()) // (1024 * 1024)
+        upstream_retries = sum(r.reconnects for r in _radio_relays.values())
+        lines.append(
+            f"Radio relays: {len(_radio_relays)} upstreams, {listeners} listeners, "
+            f"{relayed} MB in, {upstream_retries} upstream reconnects"
+        )
+    lines.append(
+        f"Radio call reconnects: {radio_reconnect_total['ok']} ok, {radio_reconnect_total['failed']} gave up, "
+        f"{sum(radio_reconnects.values())} in live sessions"
+    )
+    if tg_download_stats["count"]:
+        avg = tg_download_stats["bytes"] / max(tg_download_stats["seconds"], 1e-6) / (1024 * 1024)
+        lines.append(
+            f"Telegram downloads: {tg_download_stats['count']}, avg {avg:.2f} MiB/s, "
+            f"last {tg_download_stats['last_mbps']:.2f} MiB/s"
+        )
+    if switch_stats["count"]:
+        lines.append(
+            f"Track switches: {switch_stats['count']}, avg {switch_stats['total_ms'] / switch_stats['count']:.0f} ms, "
+            f"max {switch_stats['max_ms']:.0f} ms, last {switch_stats['last_ms']:.0f} ms, "
+            f"{switch_stats['under_1s']} under 1s"
+        )
+    lines.append(
+        f"Calls: {len(radio_state)}/{MAX_CALLS or '∞'} active, {len(call_waiting)} waiting, "
+        f"{_live_reservations()} reserved; {call_budget_stats['waited']} waited, "
+        f"{call_budget_stats['rejected']} turned away, {call_budget_stats['timed_out']} timed out"
+    )
+    lines.append(
+        "Memory (approx): "
+        + ", ".join(f"{name} {count}/{size // 1024} KiB" for name, count, size in memory_report())
+        + f"; {session_stats['evicted']} chats evicted"
+    )
+    lines.append(
+        f"Listeners: {sum(call_listeners.values())} in {len(call_listeners)} tracked calls, "
+        f"{len(_empty_since)} empty; reaped {reaper_stats['empty']} empty / {reaper_stats['paused']} paused"
+    )
+    lines.append(
+        f"Load: {SHED_NAMES[shed_level]} (loop lag {health['lag_ms']:.0f} ms, {health['render_depth']} renders, "
+        f"{health['log_backlog']} log sends pending, {health['logs_dropped']} log sends skipped, "
+        f"{health['changes']} level changes)"
+    )
+    lines.append(
+        f"Admission: {admission_stats['admitted']} admitted, rejected user {admission_stats['user']} / "
+        f"chat {admission_stats['chat']} / global {admission_stats['global']} / queue full {admission_stats['queue_full']}"
+    )
+    lines.append(
+        f"Resolver: {resolver_stats['running']}/{RESOLVER_CONCURRENCY} running, "
+        f"{resolver_stats['waiting']} waiting, {resolver_stats['rejected']} refused"
+    )
+    for slot in assistants:
+        status = "dead" if slot.dead else ("flood" if not slot.available() else "ok")
+        lines.append(
+            f"Assistant #{slot.index} @{slot.username or '?'}: {len(slot.chats)} calls, "
+            f"{len(slot.floods)} recent floods, {status}"
+        )
+    for kind, st in sorted(coalesce_stats.items()):
+        lines.append(f"Coalesced {kind}: {st['coalesced']}/{st['calls']}")
+    await message.reply_text("\n".join(lines))
+
 # ---------- CALLBACK: skip/pause/resume/stop ----------
 @bot.on_callback_query(filters.regex("^music_skip$"))
 async def cb_music_skip(_, query: CallbackQuery):
     chat_id = query.message.chat.id
     if not await dlk_privilege_validator(query):
         return await query.answer(t(chat_id, "ONLY_ADMINS_SKIP"), show_alert=True)
-    q = radio_queue.get(chat_id, [])
-    if not q:
-        await leave_voice_chat(chat_id)
+    (outcome, next_entry), coalesced = await run_in_chat(chat_id, "advance", lambda: advance_playback(chat_id))
+    if coalesced or outcome == "stale":
+        return await query.answer(t(chat_id, "MUSIC_SKIP_BTN_ALERT"), show_alert=False)
+    if outcome == "stopped":
         try:
             await query.message.edit_caption(
                 caption=t(chat_id, "MUSIC_SKIP_BTN_NO_QUEUE"),
@@ -1400,16 +4218,7 @@ async def cb_music_skip(_, query: CallbackQuery):
             {"chat_id": chat_id, "by": query.from_user.id if query.from_user else None},
         )
         return
-    next_entry = q.pop(0)
-    radio_queue[chat_id] = q
-    if chat_id in track_watchers:
-        try:
-            track_watchers[chat_id].cancel()
-        except Exception:
-            pass
-        track_watchers.pop(chat_id, None)
-    ok = await play_entry(chat_id, next_entry)
-    if ok:
+    if outcome == "played":
         try:
             await query.message.edit_caption(
                 caption=t(chat_id, "NOW_PLAYING_QUEUE", title=next_entry["title"]),
@@ -1434,24 +4243,9 @@ async def radio_pause_cb(_, query: CallbackQuery):
     if not state:
         return await query.answer(t(chat_id, "RADIO_NOTHING_PLAYING"), show_alert=True)
     try:
-        await _safe_call_py_method("pause_stream", chat_id)
-        await _safe_call_py_method("pause", chat_id)
-        start_time = state.get("start_time") or time.time()
-        elapsed = time.time() - start_time if start_time else state.get("elapsed", 0.0)
-        state["paused"] = True
-        state["elapsed"] = elapsed
-        state["start_time"] = None
-        radio_paused.add(chat_id)
-        store_play_state(
-            chat_id,
-            state.get("station"),
-            state.get("url"),
-            state.get("msg_id"),
-            None,
-            elapsed=elapsed,
-            paused=True,
-            duration=state.get("duration"),
-        )
+        paused, _ = await run_in_chat(chat_id, "pause", lambda: pause_playback(chat_id))
+        if not paused:
+            return await query.answer(t(chat_id, "RADIO_NOTHING_PLAYING"), show_alert=True)
         try:
             await query.message.edit_reply_markup(reply_markup=player_controls_markup(chat_id))
         except Exception:
@@ -1471,35 +4265,9 @@ async def radio_resume_cb(_, query: CallbackQuery):
     if not state:
         return await query.answer(t(chat_id, "NOTHING_TO_RESUME_BTN"), show_alert=True)
     try:
-        await _safe_call_py_method("resume_stream", chat_id)
-        await _safe_call_py_method("resume", chat_id)
-        elapsed = state.get("elapsed", 0.0) or 0.0
-        start_time = time.time() - elapsed
-        state["paused"] = False
-        state["elapsed"] = 0.0
-        state["start_time"] = start_time
-        radio_paused.discard(chat_id)
-        duration = state.get("duration")  # None => radio (no timer)
-        store_play_state(
-            chat_id,
-            state.get("station"),
-            state.get("url"),
-            state.get("msg_id"),
-            start_time,
-            elapsed=0.0,
-            paused=False,
-            duration=duration,
-        )
-        if duration is not None:
-            if chat_id in radio_tasks:
-                try:
-                    radio_tasks[chat_id].cancel()
-                except Exception:
-                    pass
-                radio_tasks.pop(chat_id, None)
-            radio_tasks[chat_id] = asyncio.create_task(
-                update_radio_timer(chat_id, state.get("msg_id"), state.get("station"), start_time, duration)
-            )
+        resumed, _ = await run_in_chat(chat_id, "resume", lambda: resume_playback(chat_id))
+        if not resumed:
+            return await query.answer(t(chat_id, "NOTHING_TO_RESUME_BTN"), show_alert=True)
         try:
             await query.message.edit_reply_markup(reply_markup=player_controls_markup(chat_id))
         except Exception:
@@ -1516,7 +4284,7 @@ async def cb_radio_stop(_, query: CallbackQuery):
     if not await dlk_privilege_validator(query):
         return await query.answer(t(chat_id, "ONLY_ADMINS_RADIO_BUTTON"), show_alert=True)
     try:
-        await leave_voice_chat(chat_id)
+        await run_in_chat(chat_id, "stop", lambda: stop_playback(chat_id))
         try:
             await query.message.delete()
         except Exception:
@@ -1537,81 +4305,75 @@ async def cb_radio_stop(_, query: CallbackQuery):
 @bot.on_callback_query(filters.regex("^radio_play_"))
 async def play_radio_station(_, query: CallbackQuery):
     chat_id = query.message.chat.id
-    station = query.data.replace("radio_play_", "")
-    url = RADIO_STATION.get(station)
+    station = station_catalog.from_callback(query.data.replace("radio_play_", "", 1)) or ""
+    url = station_catalog.urls.get(station)
     user = query.from_user
     if is_group_blocked_sync(chat_id):
         await query.answer(t(chat_id, "ASSISTANT_BLOCKED_GROUP"), show_alert=True)
         return
     if not url:
         return await query.answer(t(chat_id, "STATION_URL_NOT_FOUND"), show_alert=True)
+    if not await station_available(station, url):
+        return await query.answer(t(chat_id, "STATION_OFFLINE", station=station), show_alert=True)
     try:
+        source_url = await resolve_stream_url(url)
+    except StreamResolveError as e:
+        return await query.answer(t(chat_id, "STREAM_BROKEN", error=str(e))[:190], show_alert=True)
+
+    async def _start_station():
         try:
-            assistant_user = await assistant.get_me()
-            assistant_id = assistant_user.id
+            await assistant_play(chat_id, build_media_stream(chat_id, relay_url(source_url)))
+            msg = await query.message.edit_caption(
+                caption=f"🎧 {station}\n🔴 LIVE Radio",
+                reply_markup=player_controls_markup(chat_id),
+            )
         except Exception:
-            assistant_id = None
-        assistant_present = False
-        if assistant_id:
-            try:
-                await assistant.get_chat_member(chat_id, assistant_id)
-                assistant_present = True
-            except RPCError:
-                assistant_present = False
-        if not assistant_present:
-            try:
-                invite = await bot.create_chat_invite_link(chat_id, member_limit=1, name="DLK BOT assistant")
-                invite_link = invite.invite_link
-                try:
-                    await assistant.join_chat(invite_link)
-                    assistant_present = True
-                    try:
-                        await bot.send_message(chat_id, t(chat_id, "ASSISTANT_JOIN_INFO"), disable_web_page_preview=True)
-                    except Exception:
-                        pass
-                except Exception as e_join:
-                    logging.warning(f"Assistant failed to join via invite: {e_join}")
-                    assistant_present = False
-                    help_kb = InlineKeyboardMarkup([
-                        [InlineKeyboardButton("📋 Invite Link", url=invite_link)],
-                        [InlineKeyboardButton("ℹ️ How to add assistant", callback_data="assistant_invite_help")],
-                        [InlineKeyboardButton("❌ Dismiss", callback_data="radio_close")],
-                    ])
-                    await query.message.reply_text(
-                        t(chat_id, "ASSISTANT_INVITE_TEXT"),
-                        reply_markup=help_kb,
-                    )
-                    return
-            except Exception as e_inv:
-                logging.warning(f"Cannot create invite/join assistant: {e_inv}")
-                await query.message.reply_text(t(chat_id, "ASSISTANT_INVITE_FAIL_TEXT"))
-                return
-        await _safe_call_py_method("play", chat_id, MediaStream(url))
-        msg = await query.message.edit_caption(
-            caption=f"🎧 {station}\n🔴 LIVE Radio",
-            reply_markup=player_controls_markup(chat_id),
-        )
+            await leave_voice_chat(chat_id)  # still on the actor: nothing queued behind us races this
+            raise
         start_time = time.time()
+        release_state_media(chat_id)
         store_play_state(chat_id, station, url, msg.id, start_time, elapsed=0.0, paused=False, duration=None)
         radio_paused.discard(chat_id)
-        await query.answer(f"Now playing {station} via assistant!", show_alert=False)
-        log_event_sync("radio_started", {"chat_id": chat_id, "station": station, "by": user.id if user else None})
-    except FloodWait as e:
-        await leave_voice_chat(chat_id)
-        wait_time = getattr(e, "value", None) or getattr(e, "x", None) or "unknown"
-        await query.message.reply_text(t(chat_id, "RATE_LIMIT", seconds=wait_time))
-        await query.answer(f"Wait {wait_time}s", show_alert=True)
-    except ntgcalls.TelegramServerError:
-        await leave_voice_chat(chat_id)
-        await query.message.reply_text(t(chat_id, "VOICECHAT_NOT_READY"))
-        await query.answer("Voice chat not ready!", show_alert=True)
-    except RPCError as e:
-        await leave_voice_chat(chat_id)
-        await query.message.reply_text(t(chat_id, "RADIO_PLAY_FAILED_ASSIST", error=str(e)))
-    except Exception as e:
-        await leave_voice_chat(chat_id)
-        logging.error("General radio play error", exc_info=True)
-        await query.message.reply_text(t(chat_id, "RADIO_START_FAIL", error=str(e)))
+        start_radio_supervisor(chat_id, url)
+
+    async def _notify(text: str):
+        try:
+            await query.message.reply_text(text)
+        except Exception:
+            pass
+
+    async def _answer(text: str, show_alert: bool = False):
+        try:
+            await query.answer(text, show_alert=show_alert)
+        except RPCError:
+            pass  # the query may have expired while waiting for a slot
+
+    async def _start():
+        try:
+            if await ensure_assistant(chat_id, query.message) is None:
+                release_call_slot(chat_id)
+                return
+            await run_in_chat(chat_id, "play", _start_station)
+            await _answer(f"Now playing {station} via assistant!")
+            log_event_sync("radio_started", {"chat_id": chat_id, "station": station, "by": user.id if user else None})
+        except FloodWait as e:
+            release_call_slot(chat_id)  # the actor already left if the call was started
+            wait_time = getattr(e, "value", None) or getattr(e, "x", None) or "unknown"
+            await query.message.reply_text(t(chat_id, "RATE_LIMIT", seconds=wait_time))
+            await _answer(f"Wait {wait_time}s", show_alert=True)
+        except ntgcalls.TelegramServerError:
+            release_call_slot(chat_id)
+            await query.message.reply_text(t(chat_id, "VOICECHAT_NOT_READY"))
+            await _answer("Voice chat not ready!", show_alert=True)
+        except RPCError as e:
+            release_call_slot(chat_id)
+            await query.message.reply_text(t(chat_id, "RADIO_PLAY_FAILED_ASSIST", error=str(e)))
+        except Exception as e:
+            release_call_slot(chat_id)
+            logging.error("General radio play error", exc_info=True)
+            await query.message.reply_text(t(chat_id, "RADIO_START_FAIL", error=str(e)))
+
+    await run_when_call_free(chat_id, _notify, _start)
 
 # ---------- START / HELP / LANG ----------
 @bot.on_message(filters.command(["start"]) & filters.private)
@@ -1719,6 +4481,32 @@ async def cb_set_language(_, query: CallbackQuery):
         await query.message.reply_text(text, reply_markup=lang_keyboard(current))
     await query.answer()
 
+@bot.on_message(filters.group & filters.command(["quality"]))
+async def cmd_quality(_, message: Message):
+    chat_id = message.chat.id
+    if not await dlk_privilege_validator(message):
+        return await message.reply_text(t(chat_id, "ONLY_ADMINS"))
+    current = get_chat_quality(chat_id)
+    text = t(chat_id, "QUALITY_MENU") + "\n" + t(chat_id, "QUALITY_CURRENT", profile=current.title())
+    await message.reply_text(text, reply_markup=quality_keyboard(current))
+
+@bot.on_callback_query(filters.regex(r"^set_quality_(.+)$"))
+async def cb_set_quality(_, query: CallbackQuery):
+    chat_id = query.message.chat.id
+    if not await dlk_privilege_validator(query):
+        return await query.answer(t(chat_id, "ONLY_ADMINS"), show_alert=True)
+    profile = query.data.split("_", 2)[-1]
+    if profile not in QUALITY_CHOICES:
+        return await query.answer(t(chat_id, "UNKNOWN_QUALITY"), show_alert=True)
+    set_chat_quality(chat_id, profile)
+    text = t(chat_id, "QUALITY_CHANGED", profile=profile.title())
+    try:
+        await query.message.edit_text(text, reply_markup=quality_keyboard(profile))
+    except Exception:
+        await query.message.reply_text(text, reply_markup=quality_keyboard(profile))
+    await query.answer()
+    log_event_sync("quality_changed", {"chat_id": chat_id, "profile": profile})
+
 @bot.on_callback_query(filters.regex("^open_lang_menu$"))
 async def cb_open_lang_menu(_, query: CallbackQuery):
     chat_id = query.message.chat.id
@@ -1784,22 +4572,51 @@ if __name__ == "__main__":
     logger = logging.getLogger(__name__)
     logger.info("Starting DLK Bot...")
 
+    if SHARD_FALLBACK:
+        logger.warning(
+            "SHARD_COUNT exceeds the number of ASSISTANT_SESSIONS; every shard needs its own "
+            "assistant accounts, running unsharded"
+        )
+    if SHARD_COUNT > 1 and SHARD_ID is None:
+        run_shard_front()
+        raise SystemExit(0)
+    if SHARDED:
+        logger.info(f"Shard {SHARD_ID}/{SHARD_COUNT}: {len(assistants)} assistant session(s)")
+
     try:
         init_db_sync()
     except Exception as e:
         logger.warning(f"Database initialization failed: {e}")
 
-    assistant.start()
-    call_py.start()
+    load_station_catalog()
+    download_store.sweep()
+    if AUDIO_CACHE_ENABLED:
+        audio_store.sweep()
+    load_queues_sync()
+    try:
+        asyncio.get_event_loop().run_until_complete(start_local_http())
+    except Exception as e:
+        if SHARDED:
+            raise SystemExit(f"Shard {SHARD_ID}: local endpoint failed, no updates can be routed here: {e}")
+        logger.warning(f"Local media endpoint disabled: {e}")
+
+    for slot in assistants:
+        register_call_handlers(slot.calls)
+        try:
+            slot.client.start()
+            slot.calls.start()
+            me = slot.client.get_me()
+            slot.id, slot.username = me.id, me.username
+        except Exception as e:
+            note_assistant_dead(slot, e)
+    if all(slot.dead for slot in assistants):
+        raise SystemExit("No assistant session could be started")
     bot.start()
+    if SHARDED:
+        asyncio.get_event_loop().run_until_complete(start_routed_dispatch())
 
-    try:
-        me = assistant.get_me()
-        ASSISTANT_USERNAME = me.username
-        ASSISTANT_ID = me.id
-    except Exception:
-        ASSISTANT_USERNAME = "assistant"
-        ASSISTANT_ID = None
+    ASSISTANT_USERNAME = assistants[0].username or "assistant"
+    ASSISTANT_ID = assistants[0].id
 
     try:
         bot_me = bot.get_me()
@@ -1809,13 +4626,27 @@ if __name__ == "__main__":
 
     log_event_sync("bot_started", {"ts": time.time(), "owner": OWNER_ID})
 
+    asyncio.get_event_loop().create_task(radio_probe_loop())
+    asyncio.get_event_loop().create_task(health_monitor_loop())
+    asyncio.get_event_loop().create_task(idle_reaper_loop())
+
     from pyrogram import idle
     try:
         idle()
     finally:
         try:
-            call_py.stop()
-            assistant.stop()
+            asyncio.get_event_loop().run_until_complete(close_http_session())
+        except Exception:
+            pass
+        for slot in assistants:
+            if slot.dead:
+                continue
+            try:
+                slot.calls.stop()
+                slot.client.stop()
+            except Exception:
+                pass
+        try:
             bot.stop()
         except Exception:
             pass
@@ -0,0 +1,65 @@
+"""
+Telegram download throughput: the sequential download_media stream
+against parallel_tg_download at several stream counts.
+
+    python scripts/bench_tg_download.py <chat_id> <message_id> [streams ...]
+
+Uses the bot credentials from .env (its own in-memory session, so it can
+run next to the bot); the bot must be able to see the message.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+STREAMS = [int(n) for n in sys.argv[3:]] or [1, 2, 4, 8]
+os.environ["TG_DL_CONNECTIONS"] = str(max(STREAMS))
+os.environ["TG_DL_MAX_INFLIGHT"] = str(max(STREAMS) * 2)  # keep the largest count below the reserve
+
+import DLK  # noqa: E402
+from pyrogram import Client  # noqa: E402
+
+
+def _media_size(message) -> int:
+    for attr in ("audio", "voice", "video", "document"):
+        media = getattr(message, attr, None)
+        if media is not None:
+            return media.file_size
+    raise SystemExit("message has no downloadable media")
+
+
+async def main():
+    if len(sys.argv) < 3:
+        raise SystemExit(__doc__)
+    chat_id, message_id = int(sys.argv[1]), int(sys.argv[2])
+    DLK.bot = Client(
+        "dlk_bench",
+        api_id=DLK.API_ID,
+        api_hash=DLK.API_HASH,
+        bot_token=DLK.BOT_TOKEN,
+        in_memory=True,
+        max_concurrent_transmissions=DLK.TG_DL_MAX_INFLIGHT,
+    )
+    async with DLK.bot:
+        message = await DLK.bot.get_messages(chat_id, message_id)
+        total = _media_size(message)
+        mib = total / (1024 * 1024)
+        print(f"file: {mib:.1f} MiB")
+        with tempfile.TemporaryDirectory() as tmp:
+            started = time.perf_counter()
+            await DLK.bot.download_media(message, file_name=os.path.join(tmp, "sequential"))
+            elapsed = time.perf_counter() - started
+            print(f"download_media      {elapsed:7.2f}s  {mib / elapsed:6.2f} MiB/s")
+            for streams in STREAMS:
+                DLK.TG_DL_CONNECTIONS = streams
+                started = time.perf_counter()
+                await DLK.parallel_tg_download(message, os.path.join(tmp, f"parallel{streams}"), total)
+                elapsed = time.perf_counter() - started
+                print(f"parallel x{streams:<2}        {elapsed:7.2f}s  {mib / elapsed:6.2f} MiB/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
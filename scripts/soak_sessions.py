@@ -0,0 +1,71 @@
+"""
+Memory soak for per-chat state: many chats start, queue, skip and leave
+in waves, and idle chats are evicted as the reaper would. Prints the
+traced heap and DLK.memory_report() along the way and fails if the heap
+keeps growing.
+
+    python scripts/soak_sessions.py [cycles] [chats_per_cycle]
+
+No Telegram connection is made: leaving a call is reduced to the
+bookkeeping part of leave_voice_chat.
+"""
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+for key, value in (("API_ID", "1"), ("API_HASH", "soak"), ("BOT_TOKEN", "1:soak"), ("OWNER_ID", "1")):
+    os.environ.setdefault(key, value)
+os.environ.pop("MONGO_URI", None)
+
+import DLK  # noqa: E402
+
+CYCLES = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+CHATS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+ALLOWED_GROWTH = 512 * 1024  # bytes of traced heap between the first and last sample
+
+
+async def _no_call(chat_id: int):
+    return None
+
+
+async def cycle(n: int):
+    base = -1000000000000 - n * CHATS  # fresh chat ids every cycle
+    for i in range(CHATS):
+        chat_id = base - i
+
+        async def _play(chat_id=chat_id):
+            DLK.store_play_state(chat_id, f"track {n}", "https://example.invalid/a", n, time.time(), duration=180)
+            for j in range(3):
+                DLK.queue_push(chat_id, {"title": f"q{j}", "stream_url": "https://example.invalid/b", "is_local": False})
+            DLK.queue_pop(chat_id)
+
+        await DLK.run_in_chat(chat_id, "play", _play)
+        await DLK.run_in_chat(chat_id, "stop", lambda chat_id=chat_id: DLK.leave_voice_chat(chat_id))
+    DLK.evict_inactive_chats(now=time.time() + DLK.SESSION_IDLE_TTL + 1)
+
+
+async def main():
+    DLK._force_leave_call = _no_call
+    tracemalloc.start()
+    samples = []
+    for n in range(CYCLES):
+        await cycle(n)
+        if n % max(1, CYCLES // 10) == 0 or n == CYCLES - 1:
+            await asyncio.sleep(0)  # let finished actor tasks unwind
+            gc.collect()
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append(current)
+            report = ", ".join(f"{name} {entries}" for name, entries, _ in DLK.memory_report() if entries)
+            print(f"cycle {n:6d}: heap {current / 1024:8.1f} KiB  {report or 'all per-chat maps empty'}")
+    growth = samples[-1] - samples[1] if len(samples) > 2 else 0
+    print(f"growth after warm-up: {growth / 1024:.1f} KiB")
+    if growth > ALLOWED_GROWTH:
+        raise SystemExit("per-chat state keeps growing")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())